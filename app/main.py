@@ -1,11 +1,33 @@
-from fastapi import FastAPI
+import asyncio
+import os
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 
 from .routers import chat, disease, market, schemes, utilities, users
-from .routers import auth
+from .db.database import ensure_indexes
+from .routers import auth, digest
+from .utils import chat_archive, scheduler, triage
+from .utils.ai import reset_deadline, set_deadline
+from .utils.http import COMPRESS_MIN_SIZE
+
+# Default end-to-end budget for a request; clients may ask for less via X-Request-Timeout (seconds)
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "25"))
+# Nightly jobs (digests, chat archival) are opt-in: enable on exactly one instance,
+# otherwise every worker repeats the same upstream/LLM calls
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0").lower() in ("1", "true", "yes")
+
+app = FastAPI(title="Project Kisan Backend", version="0.1.0", default_response_class=ORJSONResponse)
 
-app = FastAPI(title="Project Kisan Backend", version="0.1.0")
+# Compression: brotli when available (falls back to gzip per Accept-Encoding), else gzip only
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESS_MIN_SIZE, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESS_MIN_SIZE)
 
 # CORS (development-friendly; tighten later)
 app.add_middleware(
@@ -16,6 +38,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    budget = REQUEST_DEADLINE_S
+    try:
+        budget = min(budget, float(request.headers.get("x-request-timeout", budget)))
+    except ValueError:
+        pass
+    token = set_deadline(budget)
+    try:
+        return await call_next(request)
+    finally:
+        reset_deadline(token)
+
+
 # Routers
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(disease.router, prefix="/api", tags=["disease"])
@@ -24,6 +61,7 @@ app.include_router(schemes.router, prefix="/api", tags=["schemes"])
 app.include_router(utilities.router, prefix="/api", tags=["utilities"])
 app.include_router(users.router, prefix="/api", tags=["users"])
 app.include_router(auth.router, prefix="/api", tags=["auth"])
+app.include_router(digest.router, prefix="/api", tags=["digest"])
 
 
 @app.get("/health")
@@ -35,3 +73,27 @@ async def health_check():
 @app.on_event("startup")
 async def load_env():
     load_dotenv()
+
+
+@app.on_event("startup")
+async def create_indexes():
+    # In the background so an unreachable database does not delay startup
+    app.state.index_task = asyncio.create_task(asyncio.to_thread(ensure_indexes))
+
+
+@app.on_event("startup")
+async def warm_triage():
+    # Load the disease triage model in every worker before it is used
+    app.state.triage_warmup = asyncio.create_task(asyncio.to_thread(triage.warm_up))
+
+
+@app.on_event("startup")
+async def start_scheduler():
+    if SCHEDULER_ENABLED:
+        scheduler.schedule_daily(digest.DIGEST_HOUR_UTC, 0, digest.build_all_digests)
+        scheduler.schedule_daily(chat_archive.CHAT_ARCHIVE_HOUR_UTC, 0, chat_archive.run_archival)
+
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
@@ -2,11 +2,13 @@ import base64
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, File, Form, UploadFile
+from fastapi import APIRouter, File, Form, Request, UploadFile
 
 from ..db.database import chats_col, memories_col
 from ..utils import stt
-from ..utils.ai import generate_text
+from ..utils.chat_archive import archived_history
+from ..utils.ai import DEFAULT_FALLBACK_TEXT, generate_text
+from ..utils.http import etag_response
 
 router = APIRouter()
 
@@ -26,11 +28,18 @@ def _tts_data_url(text: str) -> str:
         return ""
 
 
-def _get_user_preamble(user_id: Optional[str]) -> str:
+def _get_user_profile(user_id: Optional[str]) -> dict:
     if not user_id:
-        return ""
+        return {}
     mem = memories_col().find_one({"userId": user_id}) or {}
-    profile = mem.get("profile", {})
+    return mem.get("profile", {}) or {}
+
+
+def _get_user_preamble(user_id: Optional[str], profile: Optional[dict] = None) -> str:
+    if not user_id:
+        return ""
+    if profile is None:
+        profile = _get_user_profile(user_id)
     crops = ", ".join(profile.get("crops", []) or [])
     soil = profile.get("soilType") or ""
     lang = profile.get("preferredLanguage") or "en"
@@ -48,24 +57,30 @@ async def send_message(
     audio: Optional[UploadFile] = File(default=None),
 ):
     query_text = text or ""
+    profile = _get_user_profile(user_id)
     if audio is not None:
         data = await audio.read()
-        query_text = stt.transcribe_audio(data, audio.content_type) or query_text
+        query_text = stt.transcribe_audio(data, audio.content_type, language=profile.get("preferredLanguage")) or query_text
 
-    preamble = _get_user_preamble(user_id)
+    preamble = _get_user_preamble(user_id, profile)
     prompt = f"{preamble}\nUser: {query_text}\nAssistant:"
     reply = generate_text(prompt)
+    # Gemini timed out or failed: keep the exchange in history, flagged, but not as memory
+    fallback = reply == DEFAULT_FALLBACK_TEXT
 
     # Save chat
-    chats_col().insert_one({
+    chat = {
         "userId": user_id,
         "query": query_text,
         "response": reply,
         "ts": datetime.utcnow(),
-    })
+    }
+    if fallback:
+        chat["fallback"] = True
+    chats_col().insert_one(chat)
 
     # very simple memory update: store last chat summary
-    if user_id:
+    if user_id and not fallback:
         memories_col().update_one(
             {"userId": user_id},
             {"$set": {"lastSummary": reply[:500]}},
@@ -76,12 +91,18 @@ async def send_message(
     return {"text": reply, "audioUrl": audio_url}
 
 
+HISTORY_LIMIT = 50
+
+
 @router.get("/chat/history")
-async def chat_history(user_id: Optional[str] = None):
+async def chat_history(request: Request, user_id: Optional[str] = None):
     q = {}
     if user_id:
         q["userId"] = user_id
-    items = list(chats_col().find(q).sort("ts", -1).limit(50))
+    items = list(chats_col().find(q).sort("ts", -1).limit(HISTORY_LIMIT))
     for it in items:
         it["_id"] = str(it["_id"])  # make JSON safe
-    return {"items": items}
+    # Older chats live in the compressed archive once past the hot window
+    if len(items) < HISTORY_LIMIT:
+        items.extend(archived_history(user_id, HISTORY_LIMIT - len(items)))
+    return etag_response(request, {"items": items})
@@ -0,0 +1,160 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import APIRouter, Query, Request
+
+from ..db.database import digests_col, memories_col
+from ..utils.ai import generate_text
+from ..utils.http import etag_response
+from .market import MANDI_PAGE_SIZE, _fetch_mandi_records, _summarize_commodity
+from .schemes import _query_schemes
+from .utilities import _weather_for_location
+
+router = APIRouter()
+
+# Nightly build settings: users are processed in batches, with a cap on in-flight
+# users and a pause between batches to stay within upstream/LLM rate limits
+DIGEST_HOUR_UTC = int(os.getenv("DIGEST_HOUR_UTC", "21"))
+DIGEST_BATCH_SIZE = int(os.getenv("DIGEST_BATCH_SIZE", "50"))
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "4"))
+DIGEST_BATCH_PAUSE_S = float(os.getenv("DIGEST_BATCH_PAUSE_S", "2"))
+DIGEST_MAX_CROPS = 5
+# Digests are dated in the user's local time; profiles may override with "timezone"
+DIGEST_DEFAULT_TZ = os.getenv("DIGEST_DEFAULT_TZ", "Asia/Kolkata")
+
+FALLBACK_TIP = "Check your fields early in the morning for pests and water stress, and plan irrigation around today's forecast."
+
+
+def _local_date(profile: Dict[str, Any]) -> str:
+    try:
+        tz = ZoneInfo(profile.get("timezone") or DIGEST_DEFAULT_TZ)
+    except (ZoneInfoNotFoundError, ValueError):
+        tz = ZoneInfo(DIGEST_DEFAULT_TZ)
+    return datetime.now(tz).strftime("%Y-%m-%d")
+
+
+def _crop_price(crop: str, state: Optional[str], district: Optional[str]) -> Dict[str, Any]:
+    try:
+        records = _fetch_mandi_records(crop, state, district, limit=MANDI_PAGE_SIZE)
+    except Exception:
+        records = []
+    summary = _summarize_commodity(records).get("summary") if records else None
+    if not summary:
+        return {"commodity": crop, "price": None}
+    return {
+        "commodity": crop,
+        "price": summary["mean_price"],
+        "bestMarket": summary["best_market"],
+        "bestPrice": summary["best_price"],
+    }
+
+
+PriceCache = Dict[Tuple[str, Optional[str], Optional[str]], "asyncio.Future[Dict[str, Any]]"]
+
+
+def _price_for(
+    crop: str, state: Optional[str], district: Optional[str], cache: Optional[PriceCache]
+) -> Awaitable[Dict[str, Any]]:
+    """Fetch a crop price off the event loop, sharing one lookup per (crop, state, district)
+    among all users of a nightly run."""
+    if cache is None:
+        return asyncio.to_thread(_crop_price, crop, state, district)
+    key = (crop, state, district)
+    fut = cache.get(key)
+    if fut is None:
+        fut = cache[key] = asyncio.ensure_future(asyncio.to_thread(_crop_price, crop, state, district))
+    return fut
+
+
+def _schemes_for(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    crops = ", ".join(profile.get("crops") or [])
+    query = f"farmer schemes for {crops or 'crops'} {profile.get('soilType') or ''}".strip()
+    try:
+        return [
+            {"title": meta.get("title"), "category": meta.get("category"), "link": meta.get("link")}
+            for meta, _ in _query_schemes(query, n_results=3)
+        ]
+    except Exception:
+        return []
+
+
+def _tip_for(profile: Dict[str, Any], weather: Dict[str, Any]) -> str:
+    prompt = (
+        "Write one short, practical farming tip for today (2 sentences max).\n"
+        f"Language: {profile.get('preferredLanguage') or 'en'}.\n"
+        f"Crops: {', '.join(profile.get('crops') or []) or '-'}. Soil: {profile.get('soilType') or '-'}.\n"
+        f"Weather: {weather.get('forecast') or '-'}, humidity {weather.get('humidity')}."
+    )
+    return generate_text(prompt, fallback=FALLBACK_TIP)
+
+
+async def build_digest(
+    user_id: str, profile: Dict[str, Any], price_cache: Optional[PriceCache] = None
+) -> Dict[str, Any]:
+    state, district = profile.get("state"), profile.get("district")
+    location = profile.get("location") or ", ".join(p for p in (district, state) if p)
+    crops = (profile.get("crops") or [])[:DIGEST_MAX_CROPS]
+
+    weather_task = asyncio.to_thread(_weather_for_location, location) if location else asyncio.sleep(0, {})
+    weather, schemes, *prices = await asyncio.gather(
+        weather_task,
+        asyncio.to_thread(_schemes_for, profile),
+        *(_price_for(c, state, district, price_cache) for c in crops),
+    )
+    tip = await asyncio.to_thread(_tip_for, profile, weather)
+    return {
+        "userId": user_id,
+        "date": _local_date(profile),
+        "generatedAt": datetime.utcnow(),
+        "language": profile.get("preferredLanguage") or "en",
+        "weather": weather,
+        "prices": prices,
+        "schemes": schemes,
+        "tip": tip,
+    }
+
+
+async def build_all_digests() -> int:
+    """Rebuild the digest for every user with a profile. Returns the number stored."""
+    sem = asyncio.Semaphore(DIGEST_CONCURRENCY)
+    # Neighbours grow the same crops; mandi prices are fetched once per run
+    price_cache: PriceCache = {}
+
+    async def _one(mem: Dict[str, Any]) -> bool:
+        async with sem:
+            try:
+                doc = await build_digest(mem["userId"], mem.get("profile") or {}, price_cache)
+                await asyncio.to_thread(digests_col().replace_one, {"userId": mem["userId"]}, doc, upsert=True)
+                return True
+            except Exception:
+                return False
+
+    stored = 0
+    last_id = None
+    while True:
+        # Each batch is a separate query run off the event loop, paging by _id
+        q: Dict[str, Any] = {"userId": {"$ne": None}, "profile": {"$exists": True}}
+        if last_id is not None:
+            q["_id"] = {"$gt": last_id}
+        batch = await asyncio.to_thread(
+            lambda: list(memories_col().find(q, {"userId": 1, "profile": 1}).sort("_id", 1).limit(DIGEST_BATCH_SIZE))
+        )
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        stored += sum(await asyncio.gather(*(_one(m) for m in batch)))
+        if len(batch) < DIGEST_BATCH_SIZE:
+            break
+        await asyncio.sleep(DIGEST_BATCH_PAUSE_S)
+    return stored
+
+
+@router.get("/digest")
+async def get_digest(request: Request, user_id: Optional[str] = Query(None)):
+    if not user_id:
+        return {"digest": None}
+    doc = digests_col().find_one({"userId": user_id}, {"_id": 0})
+    return etag_response(request, {"digest": doc})
@@ -1,8 +1,21 @@
+import json
+import time
+
 from fastapi import APIRouter, File, Form, UploadFile
+from ..utils import triage
 from ..utils.ai import vision_analyze
 
 router = APIRouter()
 
+# Returned when the vision model misses the request deadline or errors out
+FALLBACK_RESULT = json.dumps({
+    "disease": "Analysis unavailable",
+    "confidence": 0,
+    "treatment": "We could not analyze this image right now. Please retry shortly, or show the affected plant to your local agriculture officer.",
+    "pesticides": [],
+    "prevention": "Remove badly affected leaves, avoid overhead watering and keep monitoring nearby plants.",
+})
+
 
 @router.post("/disease/analyze")
 async def analyze_disease(
@@ -11,6 +24,13 @@ async def analyze_disease(
     symptoms: str | None = Form(None),
 ):
     img_bytes = await image.read()
+    started = time.perf_counter()
+
+    # Cheap on-CPU classifier first; only uncertain images go to Gemini
+    quick = await triage.triage(img_bytes)
+    if quick is not None:
+        triage.record(escalated=False, seconds=time.perf_counter() - started)
+        return quick
 
     prompt = (
         "You are an agronomist. Analyze the crop disease from the image. "
@@ -26,7 +46,8 @@ async def analyze_disease(
     )
 
 
-    text = vision_analyze(img_bytes, prompt)
+    text = vision_analyze(img_bytes, prompt, fallback=FALLBACK_RESULT)
+    triage.record(escalated=True, seconds=time.perf_counter() - started)
 
     result = {
         "disease": None,
@@ -55,3 +76,8 @@ async def analyze_disease(
         result["disease"] = "Possible disease detected"
 
     return result
+
+
+@router.get("/disease/metrics")
+async def disease_metrics():
+    return triage.metrics()
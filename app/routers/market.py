@@ -1,12 +1,54 @@
+import asyncio
+import re
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from itertools import product
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 import requests
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Request
+
+from ..db.database import mandis_col
+from ..utils.geo import GridIndex
+from ..utils.http import etag_response
+from .utilities import _geocode, _geocode_search
 
 router = APIRouter()
 
-def _fetch_mandi_records(commodity: Optional[str], state: Optional[str], district: Optional[str]):
+# Upstream paging / fan-out limits for the batch compare endpoint
+MANDI_PAGE_SIZE = 100
+MANDI_MAX_PAGES = 5
+MANDI_CONCURRENCY = 8
+MAX_COMPARE_COMMODITIES = 10
+MAX_COMPARE_DISTRICTS = 10
+MAX_NEARBY_RADIUS_KM = 200.0
+# Markets Open-Meteo could not find are retried after this long; transient errors are retried next time
+MANDI_GEOCODE_RETRY_DAYS = 7
+# Open-Meteo fair use: at most one geocoding call per interval across all background tasks
+MANDI_GEOCODE_MIN_INTERVAL_S = 1.0
+
+# In-memory spatial index over geocoded mandis, rebuilt lazily when new ones are registered
+_mandi_lock = threading.Lock()
+_mandi_index: Optional[GridIndex] = None
+_mandi_docs: List[dict] = []
+# key -> retryAfter (None once located); a market is skipped until its retry time passes
+_known_mandis: Dict[Tuple[str, ...], Optional[datetime]] = {}
+# Markets currently being geocoded by some request, so concurrent tasks do not repeat the work
+_geocoding: set = set()
+_mandi_index_dirty = True
+_geocode_lock = threading.Lock()
+_last_geocode = 0.0
+
+
+def _fetch_mandi_records(
+    commodity: Optional[str],
+    state: Optional[str],
+    district: Optional[str],
+    limit: int = 7,
+    offset: int = 0,
+):
     """Fetch mandi records from data.gov.in API. Returns a list of records or [].
     This is used as a best-effort data source; failures are swallowed by caller.
     """
@@ -19,7 +61,8 @@ def _fetch_mandi_records(commodity: Optional[str], state: Optional[str], distric
     params = {
         "api-key": API_KEY_mandi,
         "format": "json",
-        "limit": 7,
+        "limit": limit,
+        "offset": offset,
         "filters[state.keyword]": state,
         "filters[commodity]": commodity,
     }
@@ -33,6 +76,267 @@ def _fetch_mandi_records(commodity: Optional[str], state: Optional[str], distric
     return records
 
 
+def _fetch_mandi_pages(commodity: Optional[str], state: Optional[str], district: Optional[str]) -> List[dict]:
+    """Page through mandi records until a short page or MANDI_MAX_PAGES is reached.
+    Failures return whatever was collected so far.
+    """
+    records: List[dict] = []
+    for page in range(MANDI_MAX_PAGES):
+        try:
+            batch = _fetch_mandi_records(commodity, state, district, limit=MANDI_PAGE_SIZE, offset=page * MANDI_PAGE_SIZE)
+        except Exception:
+            break
+        records.extend(batch)
+        if len(batch) < MANDI_PAGE_SIZE:
+            break
+    return records
+
+
+def _parse_arrival_date(r: dict) -> datetime:
+    raw = r.get("arrival_date") or ""
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(raw, fmt)
+        except ValueError:
+            continue
+    return datetime.min
+
+
+def _to_price(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _summarize_commodity(records: List[dict]) -> dict:
+    """Reduce raw mandi records of one commodity to the latest quote per market and variety.
+
+    Returns columnar arrays (one entry per market/variety) plus commodity-wide stats.
+    Same-day rows for one market/variety (different grades) are averaged, so
+    day-over-day change always compares against the previous distinct arrival date.
+    """
+    prices = np.array([_to_price(r.get("modal_price")) for r in records], dtype=np.float64)
+    valid = ~np.isnan(prices)
+    if not valid.any():
+        return {}
+    records = [r for r, ok in zip(records, valid) if ok]
+    prices = prices[valid]
+    markets = np.array([r.get("market") or "-" for r in records])
+    districts = np.array([r.get("district") or "-" for r in records])
+    varieties = np.array([r.get("variety") or "-" for r in records])
+    keys = np.char.add(np.char.add(np.char.add(np.char.add(districts, "|"), markets), "|"), varieties)
+    days = np.array([_parse_arrival_date(r).toordinal() for r in records], dtype=np.int64)
+    mins = np.array([_to_price(r.get("min_price")) for r in records], dtype=np.float64)
+    maxs = np.array([_to_price(r.get("max_price")) for r in records], dtype=np.float64)
+
+    # Group by market/variety, newest first within each group
+    order = np.lexsort((-days, keys))
+    keys, days, prices, mins, maxs = keys[order], days[order], prices[order], mins[order], maxs[order]
+    markets, districts, varieties = markets[order], districts[order], varieties[order]
+
+    # Collapse same-day grade rows: mean modal, lowest min, highest max
+    day_start = np.flatnonzero(np.r_[True, (keys[1:] != keys[:-1]) | (days[1:] != days[:-1])])
+    counts = np.diff(np.r_[day_start, len(keys)])
+    prices = np.add.reduceat(prices, day_start) / counts
+    mins = np.fmin.reduceat(mins, day_start)
+    maxs = np.fmax.reduceat(maxs, day_start)
+    keys, days = keys[day_start], days[day_start]
+    markets, districts, varieties = markets[day_start], districts[day_start], varieties[day_start]
+
+    head = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    nxt = np.minimum(head + 1, len(keys) - 1)
+    has_prev = (head + 1 < len(keys)) & (keys[nxt] == keys[head])
+    change = np.where(has_prev, prices[head] - prices[nxt], np.nan)
+
+    latest = prices[head]
+    best = int(np.argmax(latest))
+    return {
+        "market": markets[head].tolist(),
+        "district": districts[head].tolist(),
+        "variety": varieties[head].tolist(),
+        "date": [datetime.fromordinal(int(d)).strftime("%Y-%m-%d") if d > 1 else "" for d in days[head]],
+        "modal_price": latest.tolist(),
+        "min_price": mins[head].tolist(),
+        "max_price": maxs[head].tolist(),
+        "change": change.tolist(),
+        "summary": {
+            "best_market": str(markets[head][best]),
+            "best_district": str(districts[head][best]),
+            "best_variety": str(varieties[head][best]),
+            "best_price": float(latest[best]),
+            "mean_price": float(latest.mean()),
+            "spread": float(latest.max() - latest.min()),
+            "markets": int(len(np.unique(np.char.add(np.char.add(districts[head], "|"), markets[head])))),
+        },
+    }
+
+
+def _mandi_key(*parts: Optional[str]) -> Tuple[str, ...]:
+    return tuple((p or "").strip().lower() for p in parts)
+
+
+def _load_mandi_index() -> Tuple[Optional[GridIndex], List[dict]]:
+    """Return the cached mandi index, rebuilding it from the mandis collection if stale."""
+    global _mandi_index, _mandi_docs, _mandi_index_dirty
+    with _mandi_lock:
+        if not _mandi_index_dirty and _mandi_index is not None:
+            return _mandi_index, _mandi_docs
+        try:
+            docs = list(mandis_col().find({}, {"_id": 0}))
+        except Exception:
+            return _mandi_index, _mandi_docs
+        for d in docs:
+            _known_mandis[_mandi_key(d.get("state"), d.get("district"), d.get("market"))] = (
+                None if d.get("lat") is not None else d.get("retryAfter")
+            )
+        located = [d for d in docs if d.get("lat") is not None and d.get("lon") is not None]
+        _mandi_docs = located
+        _mandi_index = GridIndex([d["lat"] for d in located], [d["lon"] for d in located])
+        _mandi_index_dirty = False
+        return _mandi_index, _mandi_docs
+
+
+def _is_known(key: Tuple[str, ...], now: datetime) -> bool:
+    if key not in _known_mandis:
+        return False
+    retry_after = _known_mandis[key]
+    return retry_after is None or retry_after > now
+
+
+def _throttle_geocode() -> None:
+    """Block until MANDI_GEOCODE_MIN_INTERVAL_S has passed since the previous geocoding call."""
+    global _last_geocode
+    with _geocode_lock:
+        wait = _last_geocode + MANDI_GEOCODE_MIN_INTERVAL_S - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        _last_geocode = time.monotonic()
+
+
+def _geocode_mandi(market: str, district: Optional[str], state: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Resolve a mandi by its market name, then its district, within India.
+    Market names often carry suffixes like "(F&V)" or "APMC" that the name search
+    cannot match, so those are stripped first. Raises on transient API errors.
+    """
+    name = re.sub(r"\(.*?\)|\bAPMC\b", "", market).strip(" ,-")
+    for candidate in (name, district):
+        if not candidate:
+            continue
+        _throttle_geocode()
+        coords = _geocode_search(candidate, country_code="IN", admin1=state)
+        if coords:
+            return coords
+    return None
+
+
+def _register_mandis(records: List[dict]) -> None:
+    """Geocode and store markets not yet in the mandis collection.
+    Runs as a background task. Markets that cannot be found are stored with null
+    coordinates and a retryAfter time; transient API failures are not stored at all,
+    so the market is tried again on a later request. A market already being geocoded
+    by another request is skipped, and calls are throttled by _throttle_geocode.
+    """
+    _load_mandi_index()
+    for r in records:
+        state, district, market = r.get("state"), r.get("district"), r.get("market")
+        key = _mandi_key(state, district, market)
+        if not market:
+            continue
+        with _mandi_lock:
+            if _is_known(key, datetime.utcnow()) or key in _geocoding:
+                continue
+            _geocoding.add(key)
+        try:
+            _register_mandi(key, state, district, market)
+        finally:
+            with _mandi_lock:
+                _geocoding.discard(key)
+
+
+def _register_mandi(key: Tuple[str, ...], state: Optional[str], district: Optional[str], market: str) -> None:
+    global _mandi_index_dirty
+    try:
+        coords = _geocode_mandi(market, district, state)
+    except Exception:
+        return
+    retry_after = None if coords else datetime.utcnow() + timedelta(days=MANDI_GEOCODE_RETRY_DAYS)
+    doc = {
+        "state": state,
+        "district": district,
+        "market": market,
+        "lat": coords[0] if coords else None,
+        "lon": coords[1] if coords else None,
+        "retryAfter": retry_after,
+    }
+    try:
+        mandis_col().update_one(
+            {"state": state, "district": district, "market": market},
+            {"$set": doc},
+            upsert=True,
+        )
+    except Exception:
+        return
+    with _mandi_lock:
+        _known_mandis[key] = retry_after
+        if coords:
+            _mandi_index_dirty = True
+
+
+async def _nearby_markets(commodity: str, lat: float, lon: float, radius_km: float) -> List[dict]:
+    """Latest prices for mandis within radius_km, ranked by price (desc) then distance."""
+    index, docs = _load_mandi_index()
+    if index is None:
+        return []
+    idx, dist = index.within(lat, lon, radius_km)
+    if not len(idx):
+        return []
+    # Nearest first, so setdefault keeps the smallest distance per (district, market)
+    distance: Dict[Tuple[str, ...], float] = {}
+    districts = set()
+    for i, d in zip(idx.tolist(), dist.tolist()):
+        m = docs[i]
+        distance.setdefault(_mandi_key(m.get("district"), m.get("market")), d)
+        districts.add((m.get("state"), m.get("district")))
+
+    sem = asyncio.Semaphore(MANDI_CONCURRENCY)
+
+    async def _fetch(state: str, district: str) -> List[dict]:
+        async with sem:
+            try:
+                return await asyncio.to_thread(_fetch_mandi_records, commodity, state, district, MANDI_PAGE_SIZE)
+            except Exception:
+                return []
+
+    results = await asyncio.gather(*(_fetch(st, dt) for st, dt in districts))
+    records = [
+        r for batch in results for r in batch
+        if _mandi_key(r.get("district"), r.get("market")) in distance
+    ]
+    if not records:
+        return []
+    stats = _summarize_commodity(records)
+    if not stats:
+        return []
+    rows = []
+    for i, market in enumerate(stats["market"]):
+        district = stats["district"][i]
+        rows.append({
+            "market": market,
+            "district": district,
+            "variety": stats["variety"][i],
+            "date": stats["date"][i],
+            "price": stats["modal_price"][i],
+            "distanceKm": round(distance[_mandi_key(district, market)], 1),
+        })
+    rows.sort(key=lambda r: (-r["price"], r["distanceKm"]))
+    return rows
+
+
+def _nan_to_none(values: list) -> list:
+    return [None if isinstance(v, float) and np.isnan(v) else v for v in values]
+
+
 def get_mandi(commodity: Optional[str], state: Optional[str], district: Optional[str]) -> str:
     """Return a formatted mandi summary string for the given location and commodity.
     Tries the public API first; if it fails or no data is found, returns a hardcoded summary.
@@ -70,23 +374,26 @@ def get_mandi(commodity: Optional[str], state: Optional[str], district: Optional
 
 @router.get("/market/prices")
 async def get_market_prices(
+    request: Request,
+    background_tasks: BackgroundTasks,
     commodity: Optional[str] = Query(None),
     state: Optional[str] = Query(None),
     district: Optional[str] = Query(None),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    location: Optional[str] = Query(None),
+    radius_km: float = Query(25.0, gt=0, le=MAX_NEARBY_RADIUS_KM),
 ):
     today_price = None
     trend = []
+    nearby = None
     try:
         # Attempt to fetch real mandi data first
         records = _fetch_mandi_records(commodity, state, district)
         if records:
+            background_tasks.add_task(_register_mandis, list(records))
             # Sort by arrival_date descending to pick most recent first when possible
-            def _parse_date(r):
-                try:
-                    return datetime.strptime(r.get("arrival_date", ""), "%Y-%m-%d")
-                except Exception:
-                    return datetime.min
-            records.sort(key=_parse_date, reverse=True)
+            records.sort(key=_parse_arrival_date, reverse=True)
 
             # Today price from the most recent record
             try:
@@ -108,6 +415,17 @@ async def get_market_prices(
     except Exception:
         pass
 
+    # "Markets near me" mode: rank geocoded mandis within radius_km by price and distance
+    if commodity and (location or (lat is not None and lon is not None)):
+        coords = (lat, lon) if lat is not None and lon is not None else _geocode(location)
+        if coords:
+            try:
+                nearby = await _nearby_markets(commodity, coords[0], coords[1], radius_km)
+            except Exception:
+                nearby = []
+            if nearby and today_price is None:
+                today_price = int(nearby[0]["price"])
+
     if today_price is None:
         base = 2000
         if commodity:
@@ -121,10 +439,69 @@ async def get_market_prices(
                 "price": max(1000, base - (i * 10) + (i % 3) * 15),
             })
 
-    return {
+    return etag_response(request, {
         "commodity": commodity,
         "state": state,
         "district": district,
         "today": {"price": today_price},
         "trend": trend,
+        "nearby": nearby,
+    })
+
+
+@router.get("/market/compare")
+async def compare_market_prices(
+    background_tasks: BackgroundTasks,
+    commodities: List[str] = Query(...),
+    state: str = Query(...),
+    districts: List[str] = Query(default=[]),
+):
+    """Compare several commodities across several districts in one call.
+
+    Upstream fetches for every (commodity, district) pair run concurrently.
+    The response is columnar: each column is a list with one entry per
+    (commodity, market) row, and `summary` is keyed by commodity.
+    """
+    commodities = [c for c in dict.fromkeys(commodities) if c]
+    districts = [d for d in dict.fromkeys(districts) if d]
+    if not commodities:
+        raise HTTPException(status_code=400, detail="At least one commodity is required")
+    if len(commodities) > MAX_COMPARE_COMMODITIES or len(districts) > MAX_COMPARE_DISTRICTS:
+        raise HTTPException(status_code=400, detail="Too many commodities or districts")
+
+    pairs = list(product(commodities, districts or [None]))
+    sem = asyncio.Semaphore(MANDI_CONCURRENCY)
+
+    async def _fetch(commodity: str, district: Optional[str]) -> List[dict]:
+        async with sem:
+            return await asyncio.to_thread(_fetch_mandi_pages, commodity, state, district)
+
+    results = await asyncio.gather(*(_fetch(c, d) for c, d in pairs))
+
+    by_commodity: dict = {c: [] for c in commodities}
+    for (commodity, _), records in zip(pairs, results):
+        by_commodity[commodity].extend(records)
+    background_tasks.add_task(_register_mandis, [r for records in results for r in records])
+
+    columns = ["commodity", "market", "district", "variety", "date", "modal_price", "min_price", "max_price", "change"]
+    data: dict = {k: [] for k in columns}
+    summary: dict = {}
+    for commodity, records in by_commodity.items():
+        stats = _summarize_commodity(records) if records else {}
+        summary[commodity] = stats.pop("summary", None)
+        if not stats:
+            continue
+        data["commodity"].extend([commodity] * len(stats["market"]))
+        for k in columns[1:]:
+            data[k].extend(stats[k])
+
+    for k in ("modal_price", "min_price", "max_price", "change"):
+        data[k] = _nan_to_none(data[k])
+
+    return {
+        "state": state,
+        "districts": districts,
+        "columns": columns,
+        "data": data,
+        "summary": summary,
     }
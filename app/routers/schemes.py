@@ -1,15 +1,22 @@
-from typing import List, Optional
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
 
 import chromadb
-from fastapi import APIRouter, Query
+import orjson
+from fastapi import APIRouter, Query, Request
 
 from ..utils.ai import embed_texts, generate_text
+from ..utils.http import etag_response, make_etag, not_modified
 
 router = APIRouter()
 
 _client = None
 _collection = None
 _seeded = False
+# Gemini summaries per scheme id; schemes are static, so each is summarized once per process
+_summaries: Dict[str, dict] = {}
+_summaries_lock = threading.Lock()
 
 
 def _ensure_collection():
@@ -53,42 +60,70 @@ def _seed_if_needed():
     _seeded = True
 
 
-@router.get("/schemes/search")
-async def search_schemes(
-    q: Optional[str] = Query(None),
-    category: Optional[str] = Query(None),
-    state: Optional[str] = Query(None),
-):
+def _query_schemes(
+    query: str,
+    category: Optional[str] = None,
+    state: Optional[str] = None,
+    n_results: int = 5,
+) -> List[Tuple[dict, str]]:
+    """Vector search over seeded schemes, returning (metadata, document) pairs after filtering.
+    The scheme id is included in the metadata as "id".
+    """
     _ensure_collection()
     _seed_if_needed()
-    query = q or "farmer subsidy"
     query_embed = embed_texts([query])[0]
-    res = _collection.query(query_embeddings=[query_embed], n_results=5)
-    items: List[dict] = []
+    res = _collection.query(query_embeddings=[query_embed], n_results=n_results)
+    out: List[Tuple[dict, str]] = []
     for i in range(len(res.get("ids", [[]])[0])):
-        meta = res["metadatas"][0][i]
+        meta = {**res["metadatas"][0][i], "id": res["ids"][0][i]}
         doc = res["documents"][0][i]
         if category and meta.get("category") and meta.get("category").lower() != category.lower():
             continue
         if state and meta.get("state") and state.lower() not in meta.get("state").lower():
             continue
+        out.append((meta, doc))
+    return out
+
+
+@router.get("/schemes/search")
+async def search_schemes(
+    request: Request,
+    q: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    state: Optional[str] = Query(None),
+):
+    results = _query_schemes(q or "farmer subsidy", category, state)
+    # The result set is fixed by the query and the matched schemes, so the ETag is too:
+    # answer 304 before doing any Gemini work
+    etag = make_etag(orjson.dumps([q, category, state, [meta["id"] for meta, _ in results]]))
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+    items = [_summarize_scheme(meta, doc) for meta, doc in results]
+    return etag_response(request, {"items": items}, etag=etag)
+
+
+def _summarize_scheme(meta: dict, doc: str) -> dict:
+    item = {"title": meta.get("title"), "link": meta.get("link")}
+    with _summaries_lock:
+        summary = _summaries.get(meta["id"])
+    if summary is None:
         # Summarize into structured fields with Gemini
         answer = generate_text(
             f"From this scheme info: {doc}. Provide a concise JSON with keys: title, eligibility, benefits, how_to_apply, link if available."
         )
-        item = {"title": meta.get("title"), "link": meta.get("link")}
         try:
-            import json
             parsed = json.loads(answer)
-            if isinstance(parsed, dict):
-                item.update(
-                    {
-                        "eligibility": parsed.get("eligibility"),
-                        "benefits": parsed.get("benefits"),
-                        "how_to_apply": parsed.get("how_to_apply"),
-                    }
-                )
         except Exception:
-            pass
-        items.append(item)
-    return {"items": items}
+            return item
+        if not isinstance(parsed, dict):
+            return item
+        summary = {
+            "eligibility": parsed.get("eligibility"),
+            "benefits": parsed.get("benefits"),
+            "how_to_apply": parsed.get("how_to_apply"),
+        }
+        with _summaries_lock:
+            _summaries[meta["id"]] = summary
+    item.update(summary)
+    return item
@@ -1,20 +1,21 @@
 from typing import Any, Dict, Optional
 
-from fastapi import APIRouter, Body, Query
+from fastapi import APIRouter, Body, Query, Request
 
 from ..db.database import memories_col
+from ..utils.http import etag_response
 
 router = APIRouter()
 
 
 @router.get("/users/profile")
-async def get_profile(user_id: Optional[str] = Query(None)):
+async def get_profile(request: Request, user_id: Optional[str] = Query(None)):
     if not user_id:
         # anonymous profile
         return {"profile": {}}
     mem = memories_col().find_one({"userId": user_id}) or {}
     profile = mem.get("profile") or {}
-    return {"profile": profile}
+    return etag_response(request, {"profile": profile})
 
 
 @router.put("/users/profile")
@@ -8,17 +8,32 @@ from ..utils.ai import generate_text
 router = APIRouter()
 
 
+def _geocode_search(name: str, country_code: str | None = None, admin1: str | None = None) -> tuple[float, float] | None:
+    """Open-Meteo name search. Returns None when nothing matches and raises on
+    transport/HTTP errors so callers can tell "not found" from "try again later".
+    The API matches a single place name, not comma-separated addresses.
+    When admin1 (state) is given, a result in that state is preferred.
+    """
+    params = {"name": name, "count": 5 if admin1 else 1, "language": "en"}
+    if country_code:
+        params["countryCode"] = country_code
+    # Open-Meteo geocoding API (no key)
+    r = requests.get("https://geocoding-api.open-meteo.com/v1/search", params=params, timeout=10)
+    r.raise_for_status()
+    results = r.json().get("results") or []
+    if not results:
+        return None
+    it = results[0]
+    if admin1:
+        it = next((x for x in results if (x.get("admin1") or "").lower() == admin1.lower()), it)
+    return float(it["latitude"]), float(it["longitude"])
+
+
 def _geocode(location: str) -> tuple[float, float] | None:
     try:
-        # Open-Meteo geocoding API (no key)
-        r = requests.get("https://geocoding-api.open-meteo.com/v1/search", params={"name": location, "count": 1, "language": "en"}, timeout=10)
-        j = r.json()
-        if j.get("results"):
-            it = j["results"][0]
-            return float(it["latitude"]), float(it["longitude"])
+        return _geocode_search(location)
     except Exception:
         return None
-    return None
 
 
 def _weather_for_location(location: str) -> Dict[str, Any]:
@@ -1,9 +1,142 @@
+import hashlib
 import os
-from typing import List, Optional
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import ContextVar, Token
+from typing import Callable, List, Optional
 import google.generativeai as genai
 
 _configured = False
 
+# Per-call ceiling; the effective timeout is the smaller of this and the request deadline
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "20"))
+# Hedging: fire a second identical request if the first is slower than the recent p95
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0").lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN_DELAY_S = float(os.getenv("LLM_HEDGE_MIN_DELAY_S", "1.5"))
+LLM_HEDGE_MIN_SAMPLES = 20
+
+DEFAULT_FALLBACK_TEXT = (
+    "Sorry, I could not get an answer in time. Please try again in a moment, "
+    "or contact your local Krishi Vigyan Kendra for urgent help."
+)
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_WORKERS", "16")), thread_name_prefix="llm")
+_latencies: deque = deque(maxlen=200)
+_answer_cache: "OrderedDict[str, str]" = OrderedDict()
+_cache_lock = threading.Lock()
+ANSWER_CACHE_SIZE = 256
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def set_deadline(seconds: float) -> Token:
+    """Set the absolute deadline for LLM calls made in the current context.
+    Called by the request middleware; an earlier existing deadline is kept.
+    """
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        at = min(at, current)
+    return _deadline.set(at)
+
+
+def reset_deadline(token: Token) -> None:
+    _deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def _hedge_delay() -> float:
+    if len(_latencies) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_MIN_DELAY_S
+    ordered = sorted(_latencies)
+    return max(ordered[int(0.95 * (len(ordered) - 1))], 0.05)
+
+
+def _call_with_deadline(fn: Callable[[float], str], hedge: Optional[bool] = None) -> str:
+    """Run fn on the LLM pool, bounded by the request deadline and LLM_TIMEOUT_S.
+
+    fn receives the seconds left in the budget and must pass them on as the HTTP
+    timeout: cancelling a running future does not stop it, so without that an
+    abandoned call would hold a pool thread until Gemini answers.
+
+    With hedging, a duplicate call is started after the p95 delay and the first
+    successful result wins. Raises DeadlineExceeded when time runs out, or the
+    last error when every attempt failed.
+    """
+    budget = LLM_TIMEOUT_S
+    left = time_left()
+    if left is not None:
+        budget = min(budget, left)
+    if budget <= 0:
+        raise DeadlineExceeded("request deadline already passed")
+    start = time.monotonic()
+    end = start + budget
+
+    pending = {_executor.submit(fn, budget)}
+    hedge_at = start + _hedge_delay() if (LLM_HEDGE if hedge is None else hedge) else None
+    error: Optional[BaseException] = None
+    while pending:
+        now = time.monotonic()
+        wake = min(end, hedge_at) if hedge_at is not None else end
+        done, pending = wait(pending, timeout=max(wake - now, 0), return_when=FIRST_COMPLETED)
+        for f in done:
+            if f.exception() is None:
+                _latencies.append(time.monotonic() - start)
+                for p in pending:
+                    p.cancel()
+                return f.result()
+            error = f.exception()
+        now = time.monotonic()
+        if hedge_at is not None and now >= hedge_at and now < end:
+            pending.add(_executor.submit(fn, end - now))
+            hedge_at = None
+        elif now >= end:
+            break
+    if error is not None and not pending:
+        raise error
+    raise DeadlineExceeded(f"LLM call exceeded {budget:.1f}s")
+
+
+def _cache_key(*parts: str) -> str:
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(p.encode("utf-8", "ignore"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _remember(key: str, text: str) -> None:
+    if not text:
+        return
+    with _cache_lock:
+        _answer_cache[key] = text
+        _answer_cache.move_to_end(key)
+        while len(_answer_cache) > ANSWER_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+
+def _resilient(key: str, fn: Callable[[float], str], fallback: Optional[str]) -> str:
+    """Call fn within the deadline; on timeout or error return the last good
+    answer for the same input, else the templated fallback."""
+    try:
+        text = _call_with_deadline(fn)
+    except Exception:
+        with _cache_lock:
+            cached = _answer_cache.get(key)
+        return cached if cached is not None else (DEFAULT_FALLBACK_TEXT if fallback is None else fallback)
+    _remember(key, text)
+    return text
+
 def _ensure_config():
     global _configured
     if _configured:
@@ -15,7 +148,16 @@ def _ensure_config():
     _configured = True
 
 
-def generate_text(prompt: str, system: Optional[str] = None) -> str:
+def generate_text(prompt: str, system: Optional[str] = None, fallback: Optional[str] = None) -> str:
+    """Generate text within the request deadline; see _resilient for fallback behaviour."""
+    return _resilient(_cache_key("text", system or "", prompt), lambda timeout: _generate_text(prompt, system, timeout), fallback)
+
+
+def _request_options(timeout: Optional[float]) -> Optional[dict]:
+    return {"timeout": timeout} if timeout else None
+
+
+def _generate_text(prompt: str, system: Optional[str] = None, timeout: Optional[float] = None) -> str:
     _ensure_config()
     model = genai.GenerativeModel("gemini-2.5-flash")
 
@@ -25,19 +167,32 @@ def generate_text(prompt: str, system: Optional[str] = None) -> str:
     parts.append({"text": prompt})
 
     resp = model.generate_content(
-        [{"role": "user", "parts": parts}]
+        [{"role": "user", "parts": parts}],
+        request_options=_request_options(timeout),
     )
     return resp.text or ""
 
 
-def generate_json(prompt: str) -> str:
+def generate_json(prompt: str, fallback: Optional[str] = None) -> str:
+    return _resilient(_cache_key("json", prompt), lambda timeout: _generate_json(prompt, timeout), "{}" if fallback is None else fallback)
+
+
+def _generate_json(prompt: str, timeout: Optional[float] = None) -> str:
     _ensure_config()
     model = genai.GenerativeModel("gemini-2.5-flash")
-    resp = model.generate_content([{"role": "user", "parts": [{"text": prompt}]}])
+    resp = model.generate_content(
+        [{"role": "user", "parts": [{"text": prompt}]}],
+        request_options=_request_options(timeout),
+    )
     return resp.text or ""
 
 
-def vision_analyze(image_bytes: bytes, prompt: str) -> str:
+def vision_analyze(image_bytes: bytes, prompt: str, fallback: Optional[str] = None) -> str:
+    key = _cache_key("vision", prompt, hashlib.sha1(image_bytes).hexdigest())
+    return _resilient(key, lambda timeout: _vision_analyze(image_bytes, prompt, timeout), "" if fallback is None else fallback)
+
+
+def _vision_analyze(image_bytes: bytes, prompt: str, timeout: Optional[float] = None) -> str:
     _ensure_config()
     model = genai.GenerativeModel(
         "gemini-2.5-flash",
@@ -57,7 +212,7 @@ def vision_analyze(image_bytes: bytes, prompt: str) -> str:
                 }
             ]
         }
-    ])
+    ], request_options=_request_options(timeout))
 
     return resp.text or ""
 
@@ -0,0 +1,174 @@
+"""Chat lifecycle: recent chats stay in chats_col, older ones are moved into
+zstd-compressed per-user monthly blobs in chat_archive_col."""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+import zstandard
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+
+from ..db.database import chat_archive_col, chats_col, locks_col
+
+CHAT_HOT_DAYS = int(os.getenv("CHAT_HOT_DAYS", "30"))
+CHAT_ARCHIVE_HOUR_UTC = int(os.getenv("CHAT_ARCHIVE_HOUR_UTC", "22"))
+CHAT_ARCHIVE_BATCH = int(os.getenv("CHAT_ARCHIVE_BATCH", "500"))
+CHAT_ARCHIVE_PAUSE_S = float(os.getenv("CHAT_ARCHIVE_PAUSE_S", "1"))
+CHAT_ARCHIVE_MAX_BATCHES = int(os.getenv("CHAT_ARCHIVE_MAX_BATCHES", "200"))
+ZSTD_LEVEL = 10
+# Optimistic-concurrency retries for a month blob that changed under us
+CHAT_ARCHIVE_WRITE_RETRIES = 5
+# Only one instance archives at a time; the lease is renewed every batch
+CHAT_ARCHIVE_LEASE_S = 600
+_LEASE_ID = "chat_archive"
+
+logger = logging.getLogger(__name__)
+
+
+def _compress(items: List[Dict[str, Any]]) -> Binary:
+    return Binary(zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(orjson.dumps(items)))
+
+
+def _decompress(blob: bytes) -> List[Dict[str, Any]]:
+    return orjson.loads(zstandard.ZstdDecompressor().decompress(blob))
+
+
+def _to_item(doc: Dict[str, Any]) -> Dict[str, Any]:
+    item = dict(doc)
+    item["_id"] = str(item["_id"])
+    # Stored as ISO strings so archived items sort and serialize like hot ones
+    if isinstance(item.get("ts"), datetime):
+        item["ts"] = item["ts"].isoformat()
+    return item
+
+
+def _merge_month(user_id: Optional[str], month: str, group: List[Dict[str, Any]]) -> bool:
+    """Merge hot chats into their month blob with a version-checked write.
+
+    Returns False if the blob kept changing concurrently; the caller then leaves
+    the hot documents in place for the next run.
+    """
+    new_items = [_to_item(d) for d in group]
+    for _ in range(CHAT_ARCHIVE_WRITE_RETRIES):
+        existing = chat_archive_col().find_one({"userId": user_id, "month": month})
+        items = _decompress(existing["blob"]) if existing else []
+        seen = {it["_id"] for it in items}
+        items.extend(it for it in new_items if it["_id"] not in seen)
+        items.sort(key=lambda it: it.get("ts") or "")
+        version = (existing or {}).get("version", 0)
+        doc = {
+            "userId": user_id,
+            "month": month,
+            "count": len(items),
+            "version": version + 1,
+            "blob": _compress(items),
+        }
+        if existing is None:
+            try:
+                chat_archive_col().insert_one(doc)
+                return True
+            except DuplicateKeyError:
+                continue
+        # Blobs written before versioning have no version field; match that as version 0
+        version_filter = {"version": version} if version else {"version": {"$exists": False}}
+        res = chat_archive_col().replace_one({"_id": existing["_id"], **version_filter}, doc)
+        if res.matched_count == 1:
+            return True
+    return False
+
+
+def archive_batch(cutoff: datetime, limit: int = CHAT_ARCHIVE_BATCH) -> int:
+    """Move up to `limit` chats older than cutoff into the archive. Returns how many moved.
+
+    Hot documents are deleted only after their month blob has been written, so a
+    failure part-way leaves them in place to be retried (the merge dedupes by _id).
+    A group that fails (e.g. its blob would exceed the document size limit) is
+    logged and skipped so the other groups still move.
+    """
+    docs = list(chats_col().find({"ts": {"$lt": cutoff}}).sort("ts", 1).limit(limit))
+    if not docs:
+        return 0
+    groups: Dict[Tuple[Optional[str], str], List[Dict[str, Any]]] = defaultdict(list)
+    for d in docs:
+        groups[(d.get("userId"), d["ts"].strftime("%Y-%m"))].append(d)
+
+    moved = 0
+    for (user_id, month), group in groups.items():
+        try:
+            if not _merge_month(user_id, month, group):
+                continue
+            chats_col().delete_many({"_id": {"$in": [d["_id"] for d in group]}})
+        except Exception:
+            logger.warning("Archiving %d chats for user %s, %s failed", len(group), user_id, month, exc_info=True)
+            continue
+        moved += len(group)
+    return moved
+
+
+def _acquire_lease(owner: str) -> bool:
+    """Take or renew the archival lease. Fails while another owner holds an unexpired one."""
+    now = datetime.utcnow()
+    try:
+        locks_col().update_one(
+            {"_id": _LEASE_ID, "$or": [{"expiresAt": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "expiresAt": now + timedelta(seconds=CHAT_ARCHIVE_LEASE_S)}},
+            upsert=True,
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def _release_lease(owner: str) -> None:
+    try:
+        locks_col().delete_one({"_id": _LEASE_ID, "owner": owner})
+    except Exception:
+        pass
+
+
+async def run_archival() -> int:
+    """Scheduled job: archive chats past the hot window in rate-limited batches.
+    Skipped if another instance holds the archival lease."""
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    cutoff = datetime.utcnow() - timedelta(days=CHAT_HOT_DAYS)
+    total = 0
+    try:
+        for _ in range(CHAT_ARCHIVE_MAX_BATCHES):
+            if not await asyncio.to_thread(_acquire_lease, owner):
+                break
+            moved = await asyncio.to_thread(archive_batch, cutoff)
+            total += moved
+            if moved < CHAT_ARCHIVE_BATCH:
+                break
+            await asyncio.sleep(CHAT_ARCHIVE_PAUSE_S)
+    finally:
+        await asyncio.to_thread(_release_lease, owner)
+    return total
+
+
+def archived_history(user_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """Newest-first archived chats, reading monthly blobs only until `limit` is reached."""
+    if limit <= 0:
+        return []
+    q = {"userId": user_id} if user_id else {}
+    out: List[Dict[str, Any]] = []
+    month: Optional[str] = None
+    pending: List[Dict[str, Any]] = []
+    for doc in chat_archive_col().find(q).sort("month", -1):
+        if month is not None and doc["month"] != month:
+            # Finished a month (possibly spanning several users): flush it newest first
+            out.extend(sorted(pending, key=lambda it: it.get("ts") or "", reverse=True))
+            pending = []
+            if len(out) >= limit:
+                break
+        month = doc["month"]
+        pending.extend(_decompress(doc["blob"]))
+    else:
+        out.extend(sorted(pending, key=lambda it: it.get("ts") or "", reverse=True))
+    return out[:limit]
@@ -0,0 +1,61 @@
+import math
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one point to arrays of points."""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class GridIndex:
+    """In-memory spatial index bucketing points into fixed lat/lon cells.
+
+    A radius query only scans the cells overlapping the search box and then
+    computes exact distances for those candidates, so lookups stay in the
+    microsecond range for a few thousand points.
+    """
+
+    def __init__(self, lats: Sequence[float], lons: Sequence[float], cell_deg: float = 0.25):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.cell_deg = cell_deg
+        cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        rows = np.floor(self.lats / cell_deg).astype(np.int64)
+        cols = np.floor(self.lons / cell_deg).astype(np.int64)
+        for i, key in enumerate(zip(rows.tolist(), cols.tolist())):
+            cells[key].append(i)
+        self._cells = {k: np.asarray(v, dtype=np.int64) for k, v in cells.items()}
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def within(self, lat: float, lon: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (indices, distances_km) of points within radius, nearest first."""
+        if not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        dlat = radius_km / 111.0
+        dlon = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        r0, r1 = math.floor((lat - dlat) / self.cell_deg), math.floor((lat + dlat) / self.cell_deg)
+        c0, c1 = math.floor((lon - dlon) / self.cell_deg), math.floor((lon + dlon) / self.cell_deg)
+        found = [
+            self._cells[(r, c)]
+            for r in range(r0, r1 + 1)
+            for c in range(c0, c1 + 1)
+            if (r, c) in self._cells
+        ]
+        if not found:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        idx = np.concatenate(found)
+        dist = haversine_km(lat, lon, self.lats[idx], self.lons[idx])
+        keep = dist <= radius_km
+        idx, dist = idx[keep], dist[keep]
+        order = np.argsort(dist, kind="stable")
+        return idx[order], dist[order]
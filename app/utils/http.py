@@ -0,0 +1,39 @@
+import hashlib
+from typing import Any, Optional
+
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+
+# Minimum body size (bytes) before responses are compressed
+COMPRESS_MIN_SIZE = 1024
+
+
+def make_etag(data: bytes) -> str:
+    return f'W/"{hashlib.blake2b(data, digest_size=16).hexdigest()}"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Return a 304 response when etag matches the client's If-None-Match, else None."""
+    inm = request.headers.get("if-none-match") or ""
+    candidates = {t.strip().removeprefix("W/") for t in inm.split(",")}
+    if etag.removeprefix("W/") in candidates or "*" in candidates:
+        return Response(status_code=304, headers=_cache_headers(etag))
+    return None
+
+
+def _cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def etag_response(request: Request, payload: Any, etag: Optional[str] = None) -> Response:
+    """Serialize payload once and answer 304 when it matches the client's If-None-Match.
+
+    The ETag is weak because the compression middleware may re-encode the body.
+    Callers whose payload is not deterministic pass their own etag, derived from the inputs.
+    """
+    body = orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    etag = etag or make_etag(body)
+    return not_modified(request, etag) or Response(
+        content=body, media_type=ORJSONResponse.media_type, headers=_cache_headers(etag)
+    )
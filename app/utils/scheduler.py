@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List
+
+_tasks: List[asyncio.Task] = []
+
+
+def _seconds_until(hour: int, minute: int = 0) -> float:
+    now = datetime.utcnow()
+    nxt = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if nxt <= now:
+        nxt += timedelta(days=1)
+    return (nxt - now).total_seconds()
+
+
+async def _daily(hour: int, minute: int, job: Callable[[], Awaitable[None]]) -> None:
+    while True:
+        await asyncio.sleep(_seconds_until(hour, minute))
+        try:
+            await job()
+        except Exception:
+            # Keep the schedule alive; the job runs again tomorrow
+            pass
+
+
+def schedule_daily(hour: int, minute: int, job: Callable[[], Awaitable[None]]) -> None:
+    """Run job every day at hour:minute UTC on the running event loop."""
+    _tasks.append(asyncio.create_task(_daily(hour, minute, job)))
+
+
+async def stop() -> None:
+    for t in _tasks:
+        t.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -1,5 +1,9 @@
+import json
+import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import subprocess
 import numpy as np
@@ -7,6 +11,256 @@ import soundfile as sf
 import speech_recognition as sr
 
 
+SAMPLE_RATE = 16000
+
+# Voice activity detection / segmentation settings
+VAD_FRAME_MS = 30
+VAD_PAD_MS = 200
+VAD_MIN_PAUSE_MS = 300
+MAX_SEGMENT_S = float(os.getenv("STT_MAX_SEGMENT_S", "20"))
+STT_WORKERS = int(os.getenv("STT_WORKERS", "4"))
+
+# Recognizer backend: "google" (web API), "vosk" (local CPU model) or "auto"
+# (vosk when a model exists for the user's language, else google)
+STT_BACKEND = os.getenv("STT_BACKEND", "auto").lower()
+# One Vosk model directory per language code, e.g. models/vosk/en, models/vosk/hi
+VOSK_MODEL_DIR = os.getenv("VOSK_MODEL_DIR", "models/vosk")
+STT_LOCAL_WORKERS = int(os.getenv("STT_LOCAL_WORKERS", "2"))
+
+# Profile preferredLanguage -> Google locale
+_GOOGLE_LOCALES = {
+    "en": "en-IN",
+    "hi": "hi-IN",
+    "kn": "kn-IN",
+    "te": "te-IN",
+    "ta": "ta-IN",
+    "mr": "mr-IN",
+    "bn": "bn-IN",
+    "gu": "gu-IN",
+    "pa": "pa-IN",
+    "ml": "ml-IN",
+}
+_LANGUAGE_NAMES = {
+    "english": "en",
+    "hindi": "hi",
+    "kannada": "kn",
+    "telugu": "te",
+    "tamil": "ta",
+    "marathi": "mr",
+    "bengali": "bn",
+    "gujarati": "gu",
+    "punjabi": "pa",
+    "malayalam": "ml",
+}
+
+_pool: ThreadPoolExecutor | None = None
+_local_pool: ProcessPoolExecutor | None = None
+# Set when Vosk workers die; everything goes to Google until restart
+_local_failed = False
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=STT_WORKERS, thread_name_prefix="stt")
+    return _pool
+
+
+def _language_code(language: Optional[str]) -> str:
+    """Normalize a preferredLanguage value ("hi", "hi-IN", "Hindi") to a short code."""
+    if not language:
+        return "en"
+    lang = language.strip().lower()
+    lang = _LANGUAGE_NAMES.get(lang, lang)
+    return lang.split("-")[0].split("_")[0] or "en"
+
+
+def _vosk_model_path(lang: str) -> Optional[str]:
+    path = os.path.join(VOSK_MODEL_DIR, lang)
+    return path if os.path.isdir(path) else None
+
+
+def _vosk_available(lang: str) -> bool:
+    if _vosk_model_path(lang) is None:
+        return False
+    try:
+        import vosk  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _select_backend(lang: str, backend: Optional[str] = None) -> str:
+    choice = (backend or STT_BACKEND).lower()
+    if choice in ("vosk", "auto") and not _local_failed and _vosk_available(lang):
+        return "vosk"
+    return "google"
+
+
+# --- Local (Vosk) backend: models stay loaded inside worker processes ---
+
+_vosk_models: Dict[str, object] = {}
+
+
+def _vosk_worker_init() -> None:
+    """Preload every available model once per worker process."""
+    try:
+        from vosk import SetLogLevel
+        SetLogLevel(-1)
+    except ImportError:
+        return
+    if os.path.isdir(VOSK_MODEL_DIR):
+        for lang in os.listdir(VOSK_MODEL_DIR):
+            _vosk_model(lang)
+
+
+def _vosk_model(lang: str):
+    model = _vosk_models.get(lang)
+    if model is None:
+        from vosk import Model
+        path = _vosk_model_path(lang)
+        if path is None:
+            return None
+        model = _vosk_models[lang] = Model(path)
+    return model
+
+
+def _recognize_vosk(wav: bytes, lang: str) -> str:
+    """Runs inside a local worker process."""
+    from vosk import KaldiRecognizer
+    model = _vosk_model(lang)
+    if model is None:
+        return ""
+    pcm, rate = sf.read(BytesIO(wav), dtype="int16")
+    rec = KaldiRecognizer(model, rate)
+    rec.AcceptWaveform(pcm.tobytes())
+    return json.loads(rec.FinalResult()).get("text", "")
+
+
+def _get_local_pool() -> ProcessPoolExecutor:
+    global _local_pool
+    if _local_pool is None:
+        _local_pool = ProcessPoolExecutor(max_workers=STT_LOCAL_WORKERS, initializer=_vosk_worker_init)
+    return _local_pool
+
+
+def _frame_activity(samples: np.ndarray, rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Return a boolean speech mask with one entry per VAD_FRAME_MS frame.
+
+    A frame is speech when its energy is well above the estimated noise floor,
+    or moderately above it with a high zero-crossing rate (unvoiced consonants).
+    """
+    frame = int(rate * VAD_FRAME_MS / 1000)
+    n = len(samples) // frame
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    frames = samples[: n * frame].reshape(n, frame)
+    energy = np.mean(frames ** 2, axis=1)
+    zcr = np.mean(np.abs(np.diff(np.signbit(frames), axis=1)), axis=1)
+    # Relative to the clip's own level: well above the noise floor, but never above a
+    # fraction of its loudest frames, so quiet recordings and clips without pauses still
+    # pass. The 99th percentile keeps a short utterance in long noise from being the floor.
+    noise = np.percentile(energy, 10)
+    loud = np.percentile(energy, 99)
+    threshold = max(min(noise * 6.0, loud * 0.1), 1e-8)
+    return (energy > threshold) | ((energy > threshold / 3) & (zcr > 0.3))
+
+
+def _speech_segments(samples: np.ndarray, rate: int = SAMPLE_RATE) -> List[Tuple[int, int]]:
+    """Split audio into (start, end) sample ranges of speech.
+
+    Leading/trailing silence is trimmed. Audio longer than MAX_SEGMENT_S is cut
+    at the latest pause that keeps each segment under the limit, or hard-cut
+    when no pause is available.
+    """
+    active = _frame_activity(samples, rate)
+    if not active.any():
+        return []
+    frame = int(rate * VAD_FRAME_MS / 1000)
+    pad = VAD_PAD_MS // VAD_FRAME_MS
+    speech = np.flatnonzero(active)
+    first, last = max(int(speech[0]) - pad, 0), min(int(speech[-1]) + pad + 1, len(active))
+
+    # Pause runs: contiguous inactive frames of at least VAD_MIN_PAUSE_MS; cut at their midpoints
+    inactive = np.r_[False, ~active[first:last], False].astype(np.int8)
+    edges = np.diff(inactive)
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    long_enough = (ends - starts) >= VAD_MIN_PAUSE_MS // VAD_FRAME_MS
+    cuts = first + (starts[long_enough] + ends[long_enough]) // 2
+
+    max_frames = int(MAX_SEGMENT_S * 1000 / VAD_FRAME_MS)
+    segments: List[Tuple[int, int]] = []
+    start = first
+    while last - start > max_frames:
+        options = cuts[(cuts > start) & (cuts <= start + max_frames)]
+        end = int(options[-1]) if len(options) else start + max_frames
+        segments.append((start, end))
+        start = end
+    segments.append((start, last))
+    return [(a * frame, min(b * frame, len(samples))) for a, b in segments if b > a]
+
+
+def _segment_wav(samples: np.ndarray, rate: int = SAMPLE_RATE) -> bytes:
+    out = BytesIO()
+    sf.write(out, samples, rate, format="WAV", subtype="PCM_16")
+    return out.getvalue()
+
+
+def _recognize_google(wav: bytes, lang: str = "en") -> str:
+    recognizer = sr.Recognizer()
+    with sr.AudioFile(BytesIO(wav)) as source:
+        audio = recognizer.record(source)
+    try:
+        return recognizer.recognize_google(audio, language=_GOOGLE_LOCALES.get(lang, "en-IN"))
+    except Exception:
+        return ""
+
+
+def _collect(futures: List[Future]) -> List[str]:
+    texts = []
+    for f in futures:
+        try:
+            texts.append(f.result())
+        except Exception:
+            texts.append("")
+    return texts
+
+
+def _recognize_local(chunks: List[bytes], lang: str) -> List[str]:
+    global _local_failed
+    try:
+        pool = _get_local_pool()
+        futures = [pool.submit(_recognize_vosk, c, lang) for c in chunks]
+    except Exception:
+        _local_failed = True
+        return [""] * len(chunks)
+    texts = _collect(futures)
+    if any(isinstance(f.exception(), BrokenProcessPool) for f in futures):
+        # A worker died (e.g. out of memory loading a model); the pool cannot recover
+        _local_failed = True
+    return texts
+
+
+def _recognize_chunks(chunks: List[bytes], lang: str, backend: str) -> List[str]:
+    """Recognize WAV chunks concurrently, returning texts in input order.
+
+    With the vosk backend, chunks it returns nothing for (no words recognized, or the
+    worker pool broke) are retried with Google.
+    """
+    if backend == "vosk":
+        texts = _recognize_local(chunks, lang)
+        missing = [i for i, t in enumerate(texts) if not t.strip()]
+        if missing:
+            retried = _recognize_chunks([chunks[i] for i in missing], lang, "google")
+            for i, text in zip(missing, retried):
+                texts[i] = text
+        return texts
+    if len(chunks) == 1:
+        return [_recognize_google(chunks[0], lang)]
+    pool = _get_pool()
+    return _collect([pool.submit(_recognize_google, c, lang) for c in chunks])
+
+
 def _to_wav_bytes(audio_bytes: bytes, mime_type: Optional[str]) -> bytes:
     """Return 16kHz mono WAV bytes from arbitrary input using soundfile or ffmpeg fallback."""
     # If already wav, try to resample/channel adjust via soundfile
@@ -68,12 +322,27 @@ def _to_wav_bytes(audio_bytes: bytes, mime_type: Optional[str]) -> bytes:
             return audio_bytes
 
 
-def transcribe_audio(audio_bytes: bytes, mime_type: Optional[str] = None) -> str:
+def transcribe_audio(
+    audio_bytes: bytes,
+    mime_type: Optional[str] = None,
+    language: Optional[str] = None,
+    backend: Optional[str] = None,
+) -> str:
+    """Transcribe a voice note. `language` is the user's preferredLanguage;
+    `backend` overrides STT_BACKEND ("google", "vosk" or "auto").
+    """
+    lang = _language_code(language)
     wav = _to_wav_bytes(audio_bytes, mime_type)
-    recognizer = sr.Recognizer()
-    with sr.AudioFile(BytesIO(wav)) as source:
-        audio = recognizer.record(source)
     try:
-        return recognizer.recognize_google(audio)
+        samples, rate = sf.read(BytesIO(wav), dtype="float32")
     except Exception:
-        return ""
+        # Not decodable as WAV; let the web recognizer try the raw bytes as before
+        return _recognize_google(wav, lang)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+
+    # No detected speech: send the whole clip rather than guess it is silent
+    segments = _speech_segments(samples, rate) or [(0, len(samples))]
+    chunks = [_segment_wav(samples[a:b], rate) for a, b in segments]
+    texts = _recognize_chunks(chunks, lang, _select_backend(lang, backend))
+    return " ".join(t.strip() for t in texts if t and t.strip())
@@ -0,0 +1,227 @@
+"""On-CPU disease triage: a small ONNX image classifier run before the Gemini vision call.
+
+Confident predictions for common diseases are answered from templates; everything
+else is escalated to vision_analyze. The model and its labels are optional: without
+them (or without onnxruntime/Pillow installed) every image is escalated.
+"""
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+TRIAGE_MODEL_PATH = os.getenv("TRIAGE_MODEL_PATH", "models/disease_triage.onnx")
+# One class label per line, in model output order
+TRIAGE_LABELS_PATH = os.getenv("TRIAGE_LABELS_PATH", "models/disease_triage.labels.txt")
+TRIAGE_THRESHOLD = float(os.getenv("TRIAGE_THRESHOLD", "0.85"))
+TRIAGE_TIMEOUT_S = float(os.getenv("TRIAGE_TIMEOUT_S", "2"))
+TRIAGE_WORKERS = int(os.getenv("TRIAGE_WORKERS", "2"))
+# Jobs queued or running in the pool; beyond this, images skip triage and go straight to Gemini
+TRIAGE_MAX_INFLIGHT = int(os.getenv("TRIAGE_MAX_INFLIGHT", str(TRIAGE_WORKERS * 2)))
+TRIAGE_INPUT_SIZE = 224
+
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Templated results for the classes we are willing to answer without Gemini
+TEMPLATES: Dict[str, Dict[str, Any]] = {
+    "leaf_rust": {
+        "disease": "Leaf rust",
+        "treatment": "Spray a triazole fungicide at the first sign of orange-brown pustules and repeat after 10-15 days if spread continues.",
+        "pesticides": ["Propiconazole 25% EC", "Tebuconazole 25.9% EC"],
+        "prevention": "Sow resistant varieties, avoid late sowing and excess nitrogen, and remove volunteer plants.",
+    },
+    "early_blight": {
+        "disease": "Early blight",
+        "treatment": "Remove infected lower leaves and spray a protectant fungicide every 7-10 days.",
+        "pesticides": ["Mancozeb 75% WP", "Chlorothalonil 75% WP"],
+        "prevention": "Rotate crops, mulch to stop soil splash, stake plants and water at the base.",
+    },
+    "late_blight": {
+        "disease": "Late blight",
+        "treatment": "Act quickly: remove and destroy infected plants and spray a systemic plus contact fungicide.",
+        "pesticides": ["Metalaxyl 8% + Mancozeb 64% WP", "Cymoxanil 8% + Mancozeb 64% WP"],
+        "prevention": "Use certified disease-free seed, avoid overhead irrigation and keep good spacing for airflow.",
+    },
+    "powdery_mildew": {
+        "disease": "Powdery mildew",
+        "treatment": "Spray wettable sulphur or a systemic fungicide at first appearance of white powdery patches.",
+        "pesticides": ["Wettable sulphur 80% WP", "Hexaconazole 5% EC"],
+        "prevention": "Avoid dense planting, remove infected leaves and do not over-apply nitrogen.",
+    },
+    "bacterial_leaf_blight": {
+        "disease": "Bacterial leaf blight",
+        "treatment": "Drain the field for a few days, stop nitrogen top-dressing and spray a copper-based bactericide.",
+        "pesticides": ["Copper oxychloride 50% WP", "Streptocycline (as per label)"],
+        "prevention": "Use resistant varieties, balanced fertilizer and clean irrigation channels.",
+    },
+    "healthy": {
+        "disease": "Healthy",
+        "treatment": "No disease detected. Continue regular care.",
+        "pesticides": [],
+        "prevention": "Keep monitoring weekly and maintain field hygiene.",
+    },
+}
+
+# --- Worker process side: model and labels stay loaded per process ---
+
+_session = None
+_labels: list = []
+
+
+def _worker_init() -> None:
+    global _session, _labels
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = 1
+    _session = ort.InferenceSession(TRIAGE_MODEL_PATH, opts, providers=["CPUExecutionProvider"])
+    with open(TRIAGE_LABELS_PATH, encoding="utf-8") as f:
+        _labels = [line.strip() for line in f if line.strip()]
+
+
+def _preprocess(image_bytes: bytes) -> np.ndarray:
+    from PIL import Image
+    img = Image.open(BytesIO(image_bytes)).convert("RGB").resize((TRIAGE_INPUT_SIZE, TRIAGE_INPUT_SIZE))
+    x = (np.asarray(img, dtype=np.float32) / 255.0 - _MEAN) / _STD
+    return x.transpose(2, 0, 1)[None, ...]
+
+
+def _ping() -> bool:
+    return _session is not None
+
+
+def _classify(image_bytes: bytes) -> Tuple[str, float]:
+    """Runs inside a worker process. Returns (label, probability)."""
+    x = _preprocess(image_bytes)
+    logits = _session.run(None, {_session.get_inputs()[0].name: x})[0][0]
+    probs = np.exp(logits - logits.max())
+    probs /= probs.sum()
+    best = int(np.argmax(probs))
+    return _labels[best], float(probs[best])
+
+
+# --- Server side ---
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_failed = False
+_ready = False
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+def available() -> bool:
+    if _pool_failed or not (os.path.exists(TRIAGE_MODEL_PATH) and os.path.exists(TRIAGE_LABELS_PATH)):
+        return False
+    try:
+        import onnxruntime  # noqa: F401
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=TRIAGE_WORKERS, initializer=_worker_init)
+    return _pool
+
+
+def warm_up() -> bool:
+    """Start every worker and load the model before serving traffic.
+    Blocking; run it off the event loop at startup. Triage is skipped until it finishes."""
+    global _ready, _pool_failed
+    if not available():
+        return False
+    try:
+        pool = _get_pool()
+        _ready = all(f.result() for f in [pool.submit(_ping) for _ in range(TRIAGE_WORKERS)])
+    except Exception:
+        _pool_failed = True
+        _ready = False
+    return _ready
+
+
+def _release(_future) -> None:
+    global _inflight
+    with _inflight_lock:
+        _inflight -= 1
+
+
+async def triage(image_bytes: bytes) -> Optional[Dict[str, Any]]:
+    """Return a templated result when the classifier is confident about a known
+    class, or None to escalate the image to Gemini.
+
+    Images are escalated without waiting when the pool is not warmed up yet or
+    already has TRIAGE_MAX_INFLIGHT jobs, so a backlog never builds up behind it.
+    """
+    global _pool_failed, _inflight
+    if not _ready or not available():
+        return None
+    with _inflight_lock:
+        if _inflight >= TRIAGE_MAX_INFLIGHT:
+            return None
+        _inflight += 1
+    try:
+        future = _get_pool().submit(_classify, image_bytes)
+    except Exception:
+        _release(None)
+        _pool_failed = True
+        return None
+    # The slot is freed when the job really finishes (or is cancelled), not when we stop waiting
+    future.add_done_callback(_release)
+    try:
+        # On timeout wait_for cancels the wrapped future, which drops the job if still queued
+        label, prob = await asyncio.wait_for(asyncio.wrap_future(future), timeout=TRIAGE_TIMEOUT_S)
+    except BrokenProcessPool:
+        # Workers died (e.g. the model failed to load); disable triage until restart
+        _pool_failed = True
+        return None
+    except Exception:
+        return None
+    template = TEMPLATES.get(label)
+    if template is None or prob < TRIAGE_THRESHOLD:
+        return None
+    return {**template, "confidence": round(prob, 3), "source": "triage"}
+
+
+# --- Metrics ---
+
+_metrics_lock = threading.Lock()
+_counts = {"triaged": 0, "escalated": 0}
+_latency = {"triaged": deque(maxlen=1000), "escalated": deque(maxlen=1000)}
+
+
+def record(escalated: bool, seconds: float) -> None:
+    key = "escalated" if escalated else "triaged"
+    with _metrics_lock:
+        _counts[key] += 1
+        _latency[key].append(seconds)
+
+
+def metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        counts = dict(_counts)
+        lat = {k: list(v) for k, v in _latency.items()}
+    total = counts["triaged"] + counts["escalated"]
+    out: Dict[str, Any] = {
+        "model_available": available(),
+        "ready": _ready,
+        "inflight": _inflight,
+        "threshold": TRIAGE_THRESHOLD,
+        "requests": total,
+        "triaged": counts["triaged"],
+        "escalated": counts["escalated"],
+        "escalation_rate": (counts["escalated"] / total) if total else None,
+    }
+    for k, values in lat.items():
+        out[f"{k}_latency_ms"] = {
+            "p50": float(np.percentile(values, 50) * 1000) if values else None,
+            "p95": float(np.percentile(values, 95) * 1000) if values else None,
+        }
+    return out
@@ -0,0 +1,95 @@
+"""Compare latency and accuracy of the speech-recognition backends.
+
+Usage:
+    python -m scripts.bench_stt [clips_dir] [--lang en] [--backends google,vosk] [--runs 3]
+
+clips_dir (default scripts/stt_clips) holds audio clips (wav/flac/ogg/mp3/m4a)
+each with a same-named .txt file containing the reference transcript; the
+bundled set is generated with `python -m scripts.make_stt_clips`. Reports
+per-backend p50/p95 latency and word error rate (WER).
+"""
+import argparse
+import os
+import statistics
+import time
+from typing import List, Tuple
+
+from app.utils import stt
+
+AUDIO_EXTS = {".wav", ".flac", ".ogg", ".mp3", ".m4a", ".webm"}
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "stt_clips")
+
+
+def _load_clips(clips_dir: str) -> List[Tuple[str, bytes, str]]:
+    clips = []
+    for name in sorted(os.listdir(clips_dir)):
+        base, ext = os.path.splitext(name)
+        ref_path = os.path.join(clips_dir, base + ".txt")
+        if ext.lower() not in AUDIO_EXTS or not os.path.exists(ref_path):
+            continue
+        with open(os.path.join(clips_dir, name), "rb") as f:
+            audio = f.read()
+        with open(ref_path, encoding="utf-8") as f:
+            ref = f.read().strip()
+        clips.append((name, audio, ref))
+    return clips
+
+
+def _wer(ref: str, hyp: str) -> float:
+    r, h = ref.lower().split(), hyp.lower().split()
+    if not r:
+        return 0.0 if not h else 1.0
+    prev = list(range(len(h) + 1))
+    for i, rw in enumerate(r, start=1):
+        cur = [i] + [0] * len(h)
+        for j, hw in enumerate(h, start=1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (rw != hw))
+        prev = cur
+    return prev[-1] / len(r)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips_dir", nargs="?", default=DEFAULT_DIR)
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--backends", default="google,vosk")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    clips = _load_clips(args.clips_dir)
+    if not clips:
+        raise SystemExit(
+            f"No audio clips with .txt references found in {args.clips_dir}; "
+            "run `python -m scripts.make_stt_clips` first"
+        )
+
+    lang = stt._language_code(args.lang)
+    print(f"{len(clips)} clips, language={lang}, runs={args.runs}")
+    print(f"{'backend':<8} {'p50 ms':>8} {'p95 ms':>8} {'WER':>6}")
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        if stt._select_backend(lang, backend) != backend:
+            print(f"{backend:<8} unavailable (no model / package for '{lang}')")
+            continue
+        latencies: List[float] = []
+        errors: List[float] = []
+        # Warm-up so process-pool model loading is not counted
+        stt.transcribe_audio(clips[0][1], language=lang, backend=backend)
+        for _ in range(args.runs):
+            for name, audio, ref in clips:
+                t0 = time.perf_counter()
+                hyp = stt.transcribe_audio(audio, language=lang, backend=backend)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                errors.append(_wer(ref, hyp))
+        print(
+            f"{backend:<8} {statistics.median(latencies):>8.0f} {_percentile(latencies, 95):>8.0f} "
+            f"{statistics.mean(errors):>6.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
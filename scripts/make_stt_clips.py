@@ -0,0 +1,91 @@
+"""Generate the speech benchmark clips from their reference transcripts.
+
+Usage:
+    python -m scripts.make_stt_clips [--dir scripts/stt_clips] [--voice en] [--force]
+
+Every <name>.txt in the directory is spoken with eSpeak NG and written next to
+it as a 16 kHz mono <name>.wav, the format transcribe_audio hands to the
+recognizers. Runs offline; needs `pip install espeakng-loader`, which bundles
+the eSpeak NG library and voice data. The generated clips are committed.
+"""
+import argparse
+import ctypes
+import os
+from typing import List
+
+import numpy as np
+
+from app.utils import stt
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "stt_clips")
+# Leading/trailing silence so the clips look like real voice notes to the VAD
+PAD_S = 0.5
+
+_AUDIO_OUTPUT_SYNCHRONOUS = 2
+_SynthCallback = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.POINTER(ctypes.c_short), ctypes.c_int, ctypes.c_void_p)
+
+
+class _ESpeak:
+    def __init__(self, voice: str):
+        import espeakng_loader
+
+        self._lib = ctypes.CDLL(espeakng_loader.get_library_path())
+        self.rate = self._lib.espeak_Initialize(
+            _AUDIO_OUTPUT_SYNCHRONOUS, 0, espeakng_loader.get_data_path().encode(), 0
+        )
+        if self.rate <= 0:
+            raise RuntimeError("eSpeak NG failed to initialize")
+        if self._lib.espeak_SetVoiceByName(voice.encode()) != 0:
+            raise RuntimeError(f"eSpeak NG has no voice {voice!r}")
+        self._chunks: List[np.ndarray] = []
+        # Keep a reference so the callback is not garbage collected
+        self._callback = _SynthCallback(self._on_audio)
+        self._lib.espeak_SetSynthCallback(self._callback)
+
+    def _on_audio(self, wav, n, _events) -> int:
+        if n > 0:
+            self._chunks.append(np.ctypeslib.as_array(wav, shape=(n,)).copy())
+        return 0
+
+    def speak(self, text: str) -> np.ndarray:
+        self._chunks = []
+        data = text.encode() + b"\0"
+        self._lib.espeak_Synth(data, ctypes.c_size_t(len(data)), 0, 0, 0, 0, None, None)
+        self._lib.espeak_Synchronize()
+        pcm = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int16)
+        return pcm.astype(np.float32) / 32768.0
+
+
+def _to_16k(samples: np.ndarray, rate: int) -> np.ndarray:
+    pad = np.zeros(int(PAD_S * rate), dtype=np.float32)
+    samples = np.concatenate([pad, samples, pad])
+    x_new = np.linspace(0, len(samples) - 1, int(len(samples) * stt.SAMPLE_RATE / rate))
+    return np.interp(x_new, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=DEFAULT_DIR)
+    parser.add_argument("--voice", default="en", help="eSpeak NG voice name")
+    parser.add_argument("--force", action="store_true", help="regenerate clips that already exist")
+    args = parser.parse_args()
+
+    tts = None
+    for name in sorted(os.listdir(args.dir)):
+        base, ext = os.path.splitext(name)
+        if ext != ".txt":
+            continue
+        wav_path = os.path.join(args.dir, base + ".wav")
+        if os.path.exists(wav_path) and not args.force:
+            continue
+        with open(os.path.join(args.dir, name), encoding="utf-8") as f:
+            text = f.read().strip()
+        tts = tts or _ESpeak(args.voice)
+        samples = _to_16k(tts.speak(text), tts.rate)
+        with open(wav_path, "wb") as f:
+            f.write(stt._segment_wav(samples))
+        print(f"wrote {wav_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from app.utils import ai
+
+
+class FakeLLM:
+    """Stand-in for a Gemini call: each call sleeps for the next scripted latency
+    (the last one repeats) and returns "<prefix><call number>"."""
+
+    def __init__(self, latencies, prefix="answer-", error=None):
+        self.latencies = list(latencies)
+        self.prefix = prefix
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            n = self.calls
+            self.calls += 1
+        time.sleep(self.latencies[min(n, len(self.latencies) - 1)])
+        if self.error is not None:
+            raise self.error
+        return f"{self.prefix}{n}"
+
+
+@pytest.fixture(autouse=True)
+def _reset_state(monkeypatch):
+    monkeypatch.setattr(ai, "_answer_cache", type(ai._answer_cache)())
+    monkeypatch.setattr(ai, "_latencies", type(ai._latencies)(maxlen=ai._latencies.maxlen))
+    monkeypatch.setattr(ai, "LLM_HEDGE", False)
+    yield
+
+
+@pytest.fixture
+def deadline():
+    tokens = []
+
+    def _set(seconds):
+        tokens.append(ai.set_deadline(seconds))
+
+    yield _set
+    for t in reversed(tokens):
+        ai.reset_deadline(t)
+
+
+def test_deadline_expiry_returns_templated_fallback(monkeypatch, deadline):
+    monkeypatch.setattr(ai, "_generate_text", FakeLLM([2.0]))
+    deadline(0.2)
+    start = time.monotonic()
+    assert ai.generate_text("hello", fallback="templated") == "templated"
+    assert time.monotonic() - start < 0.6
+
+
+def test_deadline_expiry_without_fallback_uses_default_text(monkeypatch, deadline):
+    monkeypatch.setattr(ai, "_generate_text", FakeLLM([2.0]))
+    deadline(0.1)
+    assert ai.generate_text("hello") == ai.DEFAULT_FALLBACK_TEXT
+
+
+def test_cached_answer_beats_templated_fallback(monkeypatch, deadline):
+    fake = FakeLLM([0.0, 2.0])
+    monkeypatch.setattr(ai, "_generate_text", fake)
+    assert ai.generate_text("same prompt", fallback="templated") == "answer-0"
+    deadline(0.2)
+    assert ai.generate_text("same prompt", fallback="templated") == "answer-0"
+    assert ai.generate_text("other prompt", fallback="templated") == "templated"
+
+
+def test_hedge_wins_over_slow_first_call():
+    # p95 of recent calls is 50 ms, so the hedge fires long before the slow call ends
+    ai._latencies.extend([0.05] * ai.LLM_HEDGE_MIN_SAMPLES)
+    fake = FakeLLM([2.0, 0.05])
+    start = time.monotonic()
+    assert ai._call_with_deadline(fake, hedge=True) == "answer-1"
+    assert time.monotonic() - start < 0.5
+    assert fake.calls == 2
+
+
+def test_no_hedge_when_first_call_is_fast():
+    ai._latencies.extend([0.2] * ai.LLM_HEDGE_MIN_SAMPLES)
+    fake = FakeLLM([0.01])
+    assert ai._call_with_deadline(fake, hedge=True) == "answer-0"
+    assert fake.calls == 1
+
+
+def test_non_timeout_error_propagates():
+    fake = FakeLLM([0.0], error=ValueError("quota exceeded"))
+    with pytest.raises(ValueError, match="quota exceeded"):
+        ai._call_with_deadline(fake, hedge=False)
+
+
+def test_deadline_expiry_raises_deadline_exceeded(deadline):
+    deadline(0.1)
+    with pytest.raises(ai.DeadlineExceeded):
+        ai._call_with_deadline(FakeLLM([1.0]), hedge=False)
+
+
+def test_budget_is_passed_on_as_request_timeout(monkeypatch, deadline):
+    seen = []
+
+    class _Model:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def generate_content(self, contents, request_options=None):
+            seen.append(request_options)
+            return type("Resp", (), {"text": "ok"})()
+
+    monkeypatch.setattr(ai, "_configured", True)
+    monkeypatch.setattr(ai.genai, "GenerativeModel", _Model)
+    deadline(5.0)
+    assert ai.generate_text("hello") == "ok"
+    assert ai.generate_json("hello") == "ok"
+    assert ai.vision_analyze(b"img", "hello") == "ok"
+    assert len(seen) == 3
+    assert all(0 < opts["timeout"] <= 5.0 for opts in seen)
+
+
+def test_hedge_gets_only_the_remaining_budget(deadline):
+    ai._latencies.extend([0.05] * ai.LLM_HEDGE_MIN_SAMPLES)
+    timeouts = []
+
+    def _fn(timeout):
+        timeouts.append(timeout)
+        time.sleep(2.0 if len(timeouts) == 1 else 0.01)
+        return "done"
+
+    deadline(1.0)
+    assert ai._call_with_deadline(_fn, hedge=True) == "done"
+    assert timeouts[0] <= 1.0
+    assert timeouts[1] < timeouts[0]
@@ -0,0 +1,38 @@
+import mongomock
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import chat
+
+
+@pytest.fixture
+def db(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(chat, "chats_col", lambda: client.db.chats)
+    monkeypatch.setattr(chat, "memories_col", lambda: client.db.memories)
+    monkeypatch.setattr(chat, "_tts_data_url", lambda text: "")
+    return client.db
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(chat.router)
+    return TestClient(app)
+
+
+def test_reply_is_saved_as_chat_and_memory(monkeypatch, db, client):
+    monkeypatch.setattr(chat, "generate_text", lambda prompt: "Water every 3 days.")
+    assert client.post("/chat/send", data={"text": "water?", "user_id": "u1"}).json()["text"] == "Water every 3 days."
+    row = db.chats.find_one({"userId": "u1"})
+    assert row["response"] == "Water every 3 days." and "fallback" not in row
+    assert db.memories.find_one({"userId": "u1"})["lastSummary"] == "Water every 3 days."
+
+
+def test_fallback_reply_is_flagged_and_not_remembered(monkeypatch, db, client):
+    monkeypatch.setattr(chat, "generate_text", lambda prompt: chat.DEFAULT_FALLBACK_TEXT)
+    db.memories.insert_one({"userId": "u1", "lastSummary": "earlier answer"})
+    assert client.post("/chat/send", data={"text": "water?", "user_id": "u1"}).json()["text"] == chat.DEFAULT_FALLBACK_TEXT
+    assert db.chats.find_one({"userId": "u1"})["fallback"] is True
+    assert db.memories.find_one({"userId": "u1"})["lastSummary"] == "earlier answer"
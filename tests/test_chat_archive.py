@@ -0,0 +1,146 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+from app.utils import chat_archive
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient().db
+    db.chat_archive.create_index([("userId", 1), ("month", -1)], unique=True)
+    monkeypatch.setattr(chat_archive, "chats_col", lambda: db.chats)
+    monkeypatch.setattr(chat_archive, "chat_archive_col", lambda: db.chat_archive)
+    monkeypatch.setattr(chat_archive, "locks_col", lambda: db.locks)
+    return db
+
+
+def _chat(user_id, ts, text="q"):
+    return {"userId": user_id, "query": text, "response": "a", "ts": ts}
+
+
+def _blob_items(db, user_id, month):
+    return chat_archive._decompress(db.chat_archive.find_one({"userId": user_id, "month": month})["blob"])
+
+
+class _Racing:
+    """Wraps the archive collection so another writer changes the blob just before our write."""
+
+    def __init__(self, col, on_insert=None, on_replace=None, times=1):
+        self._col = col
+        self._on_insert, self._on_replace = on_insert, on_replace
+        self.times = times
+
+    def __getattr__(self, name):
+        return getattr(self._col, name)
+
+    def insert_one(self, doc):
+        if self._on_insert and self.times > 0:
+            self.times -= 1
+            self._on_insert()
+        return self._col.insert_one(doc)
+
+    def replace_one(self, flt, doc):
+        if self._on_replace and self.times > 0:
+            self.times -= 1
+            self._on_replace()
+        return self._col.replace_one(flt, doc)
+
+
+def test_archive_batch_moves_old_chats_into_month_blobs(db):
+    old = datetime(2026, 8, 30)
+    db.chats.insert_many([
+        _chat("u1", old, "aug"),
+        _chat("u1", old + timedelta(days=3), "sep"),
+        _chat("u2", old, "other user"),
+        _chat("u1", datetime(2026, 10, 18), "recent"),
+    ])
+    assert chat_archive.archive_batch(datetime(2026, 10, 1)) == 3
+    assert [c["query"] for c in db.chats.find()] == ["recent"]
+    assert [it["query"] for it in _blob_items(db, "u1", "2026-08")] == ["aug"]
+    assert [it["query"] for it in _blob_items(db, "u1", "2026-09")] == ["sep"]
+    assert _blob_items(db, "u1", "2026-09")[0]["ts"] == "2026-09-02T00:00:00"
+
+
+def test_merge_retries_when_blob_version_changes(db, monkeypatch):
+    chat_archive._merge_month("u1", "2026-08", [{"_id": "a", "ts": datetime(2026, 8, 1)}])
+    col = db.chat_archive
+    racing = _Racing(col, on_replace=lambda: col.update_one({"userId": "u1"}, {"$inc": {"version": 1}}))
+    monkeypatch.setattr(chat_archive, "chat_archive_col", lambda: racing)
+
+    assert chat_archive._merge_month("u1", "2026-08", [{"_id": "b", "ts": datetime(2026, 8, 2)}])
+    doc = col.find_one({"userId": "u1"})
+    assert doc["version"] == 3
+    assert [it["_id"] for it in _blob_items(db, "u1", "2026-08")] == ["a", "b"]
+
+
+def test_merge_retries_after_losing_the_first_insert(db, monkeypatch):
+    col = db.chat_archive
+    racing = _Racing(col, on_insert=lambda: chat_archive._merge_month("u1", "2026-08", [{"_id": "theirs", "ts": "2026-08-05"}]))
+    monkeypatch.setattr(chat_archive, "chat_archive_col", lambda: racing)
+
+    assert chat_archive._merge_month("u1", "2026-08", [{"_id": "ours", "ts": datetime(2026, 8, 1)}])
+    assert [it["_id"] for it in _blob_items(db, "u1", "2026-08")] == ["ours", "theirs"]
+    assert col.count_documents({}) == 1
+
+
+def test_merge_gives_up_when_blob_keeps_changing(db, monkeypatch):
+    db.chats.insert_one(_chat("u1", datetime(2026, 8, 1)))
+    chat_archive._merge_month("u1", "2026-08", [{"_id": "a", "ts": "2026-08-01"}])
+    col = db.chat_archive
+    racing = _Racing(
+        col,
+        on_replace=lambda: col.update_one({"userId": "u1"}, {"$inc": {"version": 1}}),
+        times=chat_archive.CHAT_ARCHIVE_WRITE_RETRIES,
+    )
+    monkeypatch.setattr(chat_archive, "chat_archive_col", lambda: racing)
+
+    assert chat_archive.archive_batch(datetime(2026, 10, 1)) == 0
+    # Hot chats stay for the next run
+    assert db.chats.count_documents({}) == 1
+
+
+def test_failing_group_is_skipped(db, monkeypatch):
+    db.chats.insert_many([_chat(None, datetime(2026, 8, 1)), _chat("u1", datetime(2026, 8, 2))])
+    merge = chat_archive._merge_month
+
+    def _merge(user_id, month, group):
+        if user_id is None:
+            raise ValueError("BSON document too large")
+        return merge(user_id, month, group)
+
+    monkeypatch.setattr(chat_archive, "_merge_month", _merge)
+    assert chat_archive.archive_batch(datetime(2026, 10, 1)) == 1
+    assert [c["userId"] for c in db.chats.find()] == [None]
+    assert db.chat_archive.find_one({"userId": "u1"}) is not None
+
+
+def test_lease_is_exclusive_until_released_or_expired(db):
+    assert chat_archive._acquire_lease("a")
+    assert not chat_archive._acquire_lease("b")
+    # The holder can renew
+    assert chat_archive._acquire_lease("a")
+    chat_archive._release_lease("b")
+    assert not chat_archive._acquire_lease("b")
+    chat_archive._release_lease("a")
+    assert chat_archive._acquire_lease("b")
+
+    db.locks.update_one({"_id": chat_archive._LEASE_ID}, {"$set": {"expiresAt": datetime.utcnow() - timedelta(seconds=1)}})
+    assert chat_archive._acquire_lease("a")
+    assert db.locks.find_one()["owner"] == "a"
+
+
+def test_archived_history_is_newest_first_across_months_and_users(db):
+    for user_id, month, days in [("u1", "2026-07", [3, 20]), ("u2", "2026-08", [1]), ("u1", "2026-08", [2, 15])]:
+        chat_archive._merge_month(
+            user_id, month, [{"_id": f"{user_id}-{month}-{d}", "ts": f"{month}-{d:02d}T00:00:00"} for d in days]
+        )
+
+    assert [it["_id"] for it in chat_archive.archived_history(None, 10)] == [
+        "u1-2026-08-15", "u1-2026-08-2", "u2-2026-08-1", "u1-2026-07-20", "u1-2026-07-3",
+    ]
+    assert [it["_id"] for it in chat_archive.archived_history("u1", 3)] == [
+        "u1-2026-08-15", "u1-2026-08-2", "u1-2026-07-20",
+    ]
+    assert chat_archive.archived_history("u1", 0) == []
@@ -0,0 +1,25 @@
+import mongomock
+
+from app.db import database
+
+
+def test_index_failure_does_not_skip_later_indexes(monkeypatch, caplog):
+    db = mongomock.MongoClient().db
+
+    class _Broken:
+        def create_index(self, *args, **kwargs):
+            raise RuntimeError("not authorized")
+
+    def _mandis():
+        return _Broken()
+
+    monkeypatch.setattr(database, "mandis_col", _mandis)
+    for name in ("digests", "chats", "chat_archive"):
+        monkeypatch.setattr(database, f"{name}_col", lambda name=name: db[name])
+
+    database.ensure_indexes()
+
+    assert "Could not create index" in caplog.text
+    archive_index = db.chat_archive.index_information()["userId_1_month_-1"]
+    assert archive_index["unique"] is True
+    assert "ts_1" in db.chats.index_information()
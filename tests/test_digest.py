@@ -0,0 +1,82 @@
+import asyncio
+import re
+import threading
+
+import mongomock
+import pytest
+
+from app.routers import digest
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    calls = {"price": [], "weather": []}
+    lock = threading.Lock()
+
+    def _price(crop, state, district):
+        with lock:
+            calls["price"].append((crop, state, district))
+        return {"commodity": crop, "price": 2000.0}
+
+    def _weather(location):
+        calls["weather"].append(location)
+        return {"forecast": "Sunny", "humidity": 40}
+
+    monkeypatch.setattr(digest, "_crop_price", _price)
+    monkeypatch.setattr(digest, "_weather_for_location", _weather)
+    monkeypatch.setattr(digest, "_schemes_for", lambda profile: [{"title": "PMFBY"}])
+    monkeypatch.setattr(digest, "_tip_for", lambda profile, weather: f"tip for {weather.get('forecast')}")
+    return calls
+
+
+def test_build_digest(sources):
+    profile = {"state": "Karnataka", "district": "Dharwad", "crops": ["Maize", "Cotton"], "preferredLanguage": "kn"}
+    doc = asyncio.run(digest.build_digest("u1", profile))
+    assert doc["userId"] == "u1"
+    assert doc["language"] == "kn"
+    assert sources["weather"] == ["Dharwad, Karnataka"]
+    assert [p["commodity"] for p in doc["prices"]] == ["Maize", "Cotton"]
+    assert doc["schemes"] == [{"title": "PMFBY"}]
+    assert doc["tip"] == "tip for Sunny"
+    assert re.fullmatch(r"\d{4}-\d{2}-\d{2}", doc["date"])
+
+
+def test_build_digest_without_location_skips_weather(sources):
+    doc = asyncio.run(digest.build_digest("u1", {"crops": []}))
+    assert sources["weather"] == []
+    assert doc["weather"] == {} and doc["prices"] == []
+
+
+def test_local_date_uses_profile_timezone(monkeypatch):
+    class _Clock:
+        @staticmethod
+        def now(tz):
+            from datetime import datetime, timezone
+            # 20:00 UTC is already the next day in India but not in New York
+            return datetime(2026, 10, 18, 20, 0, tzinfo=timezone.utc).astimezone(tz)
+
+    monkeypatch.setattr(digest, "datetime", _Clock)
+    assert digest._local_date({}) == "2026-10-19"
+    assert digest._local_date({"timezone": "America/New_York"}) == "2026-10-18"
+    assert digest._local_date({"timezone": "Not/AZone"}) == "2026-10-19"
+
+
+def test_build_all_digests_pages_users_and_shares_prices(monkeypatch, sources):
+    client = mongomock.MongoClient()
+    memories, digests = client.db.memories, client.db.digests
+    monkeypatch.setattr(digest, "memories_col", lambda: memories)
+    monkeypatch.setattr(digest, "digests_col", lambda: digests)
+    monkeypatch.setattr(digest, "DIGEST_BATCH_SIZE", 2)
+    monkeypatch.setattr(digest, "DIGEST_BATCH_PAUSE_S", 0)
+    profile = {"state": "Karnataka", "district": "Dharwad", "crops": ["Maize"]}
+    memories.insert_many([{"userId": f"u{i}", "profile": profile} for i in range(5)])
+    # Not eligible: no user id, or no profile
+    memories.insert_many([{"userId": None, "profile": profile}, {"userId": "u9"}])
+
+    assert asyncio.run(digest.build_all_digests()) == 5
+    assert sorted(d["userId"] for d in digests.find()) == [f"u{i}" for i in range(5)]
+    assert sources["price"] == [("Maize", "Karnataka", "Dharwad")]
+
+    # A rerun replaces each user's digest rather than adding another
+    assert asyncio.run(digest.build_all_digests()) == 5
+    assert digests.count_documents({}) == 5
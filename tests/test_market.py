@@ -0,0 +1,138 @@
+import math
+import threading
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+from app.routers import market
+
+
+def _rec(market_name, variety, date, modal, district="Dharwad", min_price=None, max_price=None):
+    return {
+        "market": market_name,
+        "district": district,
+        "variety": variety,
+        "arrival_date": date,
+        "modal_price": modal,
+        "min_price": min_price,
+        "max_price": max_price,
+    }
+
+
+def _rows(stats):
+    keys = ["market", "district", "variety", "date", "modal_price", "min_price", "max_price", "change"]
+    return {(r["market"], r["variety"]): r for r in (dict(zip(keys, vals)) for vals in zip(*(stats[k] for k in keys)))}
+
+
+def test_summarize_groups_by_variety_and_averages_same_day_grades():
+    records = [
+        # Two grades of Local on the same day: averaged, min/max widened
+        _rec("Hubli", "Local", "02/10/2026", "2000", min_price="1900", max_price="2100"),
+        _rec("Hubli", "Local", "02/10/2026", "1800", min_price="1700", max_price="1950"),
+        _rec("Hubli", "Local", "01/10/2026", "1850"),
+        # Another variety in the same market, same day, no previous day
+        _rec("Hubli", "Hybrid", "02/10/2026", "2600"),
+        # Unparseable price is dropped
+        _rec("Hubli", "Hybrid", "01/10/2026", "n/a"),
+        _rec("Gadag", "Local", "2026-10-02", "2100", district="Gadag"),
+    ]
+    stats = market._summarize_commodity(records)
+    rows = _rows(stats)
+
+    assert set(rows) == {("Hubli", "Local"), ("Hubli", "Hybrid"), ("Gadag", "Local")}
+    local = rows[("Hubli", "Local")]
+    assert local["date"] == "2026-10-02"
+    assert local["modal_price"] == 1900.0
+    assert local["min_price"] == 1700.0
+    assert local["max_price"] == 2100.0
+    # Compared against the previous distinct date, not a same-day grade
+    assert local["change"] == 50.0
+
+    hybrid = rows[("Hubli", "Hybrid")]
+    assert hybrid["modal_price"] == 2600.0
+    assert math.isnan(hybrid["change"])
+    assert math.isnan(hybrid["min_price"])
+
+    summary = stats["summary"]
+    assert summary["best_market"] == "Hubli"
+    assert summary["best_variety"] == "Hybrid"
+    assert summary["best_price"] == 2600.0
+    assert summary["spread"] == 700.0
+    assert summary["markets"] == 2
+
+
+def test_summarize_with_no_valid_prices_is_empty():
+    assert market._summarize_commodity([_rec("Hubli", "Local", "02/10/2026", "")]) == {}
+
+
+def test_nan_to_none():
+    assert market._nan_to_none([1.0, float("nan"), None, 2]) == [1.0, None, None, 2]
+
+
+@pytest.fixture
+def mandis(monkeypatch):
+    col = mongomock.MongoClient().db.mandis
+    monkeypatch.setattr(market, "mandis_col", lambda: col)
+    monkeypatch.setattr(market, "_known_mandis", {})
+    monkeypatch.setattr(market, "_geocoding", set())
+    monkeypatch.setattr(market, "_mandi_index_dirty", True)
+    monkeypatch.setattr(market, "MANDI_GEOCODE_MIN_INTERVAL_S", 0.0)
+    return col
+
+
+def test_not_found_mandi_is_retried_after_retry_time(monkeypatch, mandis):
+    calls = []
+    monkeypatch.setattr(market, "_geocode_mandi", lambda m, d, s: calls.append(m))
+    record = {"state": "Karnataka", "district": "Dharwad", "market": "Nowhere"}
+
+    market._register_mandis([record])
+    market._register_mandis([record])
+    assert calls == ["Nowhere"]
+    assert mandis.find_one({"market": "Nowhere"})["lat"] is None
+
+    key = market._mandi_key("Karnataka", "Dharwad", "Nowhere")
+    market._known_mandis[key] = datetime.utcnow() - timedelta(seconds=1)
+    market._register_mandis([record])
+    assert calls == ["Nowhere", "Nowhere"]
+
+
+def test_transient_geocode_error_is_not_remembered(monkeypatch, mandis):
+    def _fail(*_):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(market, "_geocode_mandi", _fail)
+    market._register_mandis([{"state": "Karnataka", "district": "Dharwad", "market": "Hubli"}])
+    assert market._known_mandis == {}
+    assert mandis.count_documents({}) == 0
+
+
+def test_concurrent_requests_geocode_each_mandi_once(monkeypatch, mandis):
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def _slow(market_name, district, state):
+        calls.append(market_name)
+        started.set()
+        release.wait(2)
+        return (15.35, 75.13)
+
+    monkeypatch.setattr(market, "_geocode_mandi", _slow)
+    record = {"state": "Karnataka", "district": "Dharwad", "market": "Hubli"}
+    t = threading.Thread(target=market._register_mandis, args=([record],))
+    t.start()
+    started.wait(2)
+    market._register_mandis([record])
+    release.set()
+    t.join()
+    assert calls == ["Hubli"]
+    assert mandis.find_one({"market": "Hubli"})["lat"] == 15.35
+
+
+def test_geocode_calls_are_spaced(monkeypatch):
+    monkeypatch.setattr(market, "MANDI_GEOCODE_MIN_INTERVAL_S", 0.05)
+    monkeypatch.setattr(market, "_last_geocode", 0.0)
+    start = market.time.monotonic()
+    for _ in range(3):
+        market._throttle_geocode()
+    assert market.time.monotonic() - start >= 0.1
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import schemes
+
+PMFBY = ({"id": "pmfby", "title": "PMFBY", "link": "https://pmfby.gov.in/"}, "Crop insurance scheme.")
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = []
+
+    def _generate(prompt, *args, **kwargs):
+        calls.append(prompt)
+        return json.dumps({"eligibility": f"all farmers {len(calls)}", "benefits": "premium", "how_to_apply": "CSC"})
+
+    monkeypatch.setattr(schemes, "_query_schemes", lambda q, category=None, state=None: [PMFBY])
+    monkeypatch.setattr(schemes, "generate_text", _generate)
+    monkeypatch.setattr(schemes, "_summaries", {})
+    app = FastAPI()
+    app.include_router(schemes.router)
+    c = TestClient(app)
+    c.llm_calls = calls
+    return c
+
+
+def test_revalidation_returns_304_without_llm_calls(client):
+    first = client.get("/schemes/search", params={"q": "insurance"})
+    assert first.status_code == 200
+    assert first.json()["items"][0]["eligibility"] == "all farmers 1"
+    etag = first.headers["etag"]
+
+    again = client.get("/schemes/search", params={"q": "insurance"}, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert len(client.llm_calls) == 1
+
+
+def test_summaries_are_cached_per_scheme(client):
+    a = client.get("/schemes/search", params={"q": "insurance"})
+    b = client.get("/schemes/search", params={"q": "crop cover"})
+    assert a.json()["items"] == b.json()["items"]
+    assert a.headers["etag"] != b.headers["etag"]
+    assert len(client.llm_calls) == 1
+
+
+def test_unparseable_summary_is_not_cached(client, monkeypatch):
+    monkeypatch.setattr(schemes, "generate_text", lambda *a, **k: "not json")
+    body = client.get("/schemes/search").json()
+    assert body["items"] == [{"title": "PMFBY", "link": "https://pmfby.gov.in/"}]
+    assert schemes._summaries == {}
@@ -0,0 +1,169 @@
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from app.utils import stt
+
+RATE = stt.SAMPLE_RATE
+FREQS = [200, 400, 600, 800]
+RECOGNIZE_DELAY_S = 0.2
+
+
+def _tone(seconds: float, freq: float, amp: float = 0.3) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amp * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def _silence(seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.normal(0, 0.002, int(seconds * RATE)).astype(np.float32)
+
+
+def _wav(samples: np.ndarray) -> bytes:
+    out = BytesIO()
+    sf.write(out, samples, RATE, format="WAV", subtype="PCM_16")
+    return out.getvalue()
+
+
+def _fake_recognizer(calls):
+    """Sleeps like a network call and answers with the index of the segment's tone."""
+    def recognize(wav: bytes, lang: str = "en") -> str:
+        samples, rate = sf.read(BytesIO(wav), dtype="float32")
+        calls.append(len(samples) / rate)
+        time.sleep(RECOGNIZE_DELAY_S)
+        spectrum = np.abs(np.fft.rfft(samples))
+        peak = np.fft.rfftfreq(len(samples), 1 / rate)[int(np.argmax(spectrum))]
+        return str(int(np.argmin([abs(peak - f) for f in FREQS])))
+    return recognize
+
+
+def test_long_note_is_split_at_pauses_and_stitched_in_order(monkeypatch):
+    monkeypatch.setattr(stt, "MAX_SEGMENT_S", 3.0)
+    calls = []
+    monkeypatch.setattr(stt, "_recognize_google", _fake_recognizer(calls))
+    parts = [_silence(1.5)]
+    for f in FREQS:
+        parts += [_tone(2.0, f), _silence(0.6)]
+    parts.append(_silence(1.5))
+    audio = np.concatenate(parts)
+
+    start = time.perf_counter()
+    text = stt.transcribe_audio(_wav(audio), "audio/wav", backend="google")
+    elapsed = time.perf_counter() - start
+
+    assert text == "0 1 2 3"
+    assert len(calls) == len(FREQS)
+    # Leading/trailing silence is trimmed before recognition
+    assert sum(calls) < len(audio) / RATE - 2.0
+    # Segments are recognized concurrently, so wall time beats the serial cost
+    assert elapsed < 0.75 * RECOGNIZE_DELAY_S * len(FREQS)
+
+
+def test_note_without_pauses_is_one_segment():
+    audio = _tone(5.0, 300)
+    frame = RATE * stt.VAD_FRAME_MS // 1000
+    [(start, end)] = stt._speech_segments(audio)
+    assert start == 0 and end >= len(audio) - frame
+
+
+def test_quiet_continuous_speech_is_not_dropped(monkeypatch):
+    calls = []
+    monkeypatch.setattr(stt, "_recognize_google", _fake_recognizer(calls))
+    # ~0.0145 RMS, below any fixed absolute threshold tuned for normal recordings
+    audio = _tone(3.0, 300, amp=0.0205)
+    assert stt._speech_segments(audio)
+    assert stt.transcribe_audio(_wav(audio), "audio/wav", backend="google") != ""
+    assert len(calls) == 1
+
+
+def test_short_utterance_in_long_noise_is_trimmed():
+    # Speech is well under 10% of these clips, so percentile-based levels must not
+    # mistake the utterance for the noise floor
+    pad = RATE * (stt.VAD_PAD_MS + stt.VAD_FRAME_MS) // 1000
+    for noise_s in (6.0, 10.0, 20.0):
+        audio = np.concatenate([_silence(noise_s), _tone(1.0, 300), _silence(noise_s)])
+        tone_start, tone_end = int(noise_s * RATE), int((noise_s + 1.0) * RATE)
+        [(start, end)] = stt._speech_segments(audio)
+        assert tone_start - pad <= start <= tone_start
+        assert tone_end <= end <= tone_end + pad
+
+
+def test_clip_without_detected_speech_is_sent_whole(monkeypatch):
+    calls = []
+    monkeypatch.setattr(stt, "_recognize_google", _fake_recognizer(calls))
+    audio = np.zeros(RATE * 2, dtype=np.float32)
+    assert stt._speech_segments(audio) == []
+    stt.transcribe_audio(_wav(audio), "audio/wav", backend="google")
+    assert calls == [2.0]
+
+
+class _FakeLocalPool:
+    """Answers submits immediately with scripted Vosk results (or exceptions)."""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def submit(self, fn, *args):
+        f = Future()
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            f.set_exception(result)
+        else:
+            f.set_result(result)
+        return f
+
+
+@pytest.fixture
+def local_backend(monkeypatch):
+    monkeypatch.setattr(stt, "_local_failed", False)
+    monkeypatch.setattr(stt, "_vosk_available", lambda lang: lang == "hi")
+    google = []
+    monkeypatch.setattr(stt, "_recognize_google", lambda wav, lang="en": google.append(lang) or f"g{len(google)}")
+    return google
+
+
+def test_empty_vosk_result_falls_back_to_google(monkeypatch, local_backend):
+    monkeypatch.setattr(stt, "_get_local_pool", lambda: _FakeLocalPool(["namaste", "", "kisan"]))
+    assert stt._recognize_chunks([b"a", b"b", b"c"], "hi", "vosk") == ["namaste", "g1", "kisan"]
+    assert local_backend == ["hi"]
+    assert not stt._local_failed
+
+
+def test_broken_vosk_pool_disables_local_backend(monkeypatch, local_backend):
+    monkeypatch.setattr(stt, "_get_local_pool", lambda: _FakeLocalPool(["namaste", BrokenProcessPool()]))
+    assert stt._recognize_chunks([b"a", b"b"], "hi", "vosk") == ["namaste", "g1"]
+    assert stt._local_failed
+    assert stt._select_backend("hi", "vosk") == "google"
+
+
+def test_vosk_pool_that_cannot_submit_falls_back(monkeypatch, local_backend):
+    def _broken():
+        raise BrokenProcessPool("workers died")
+
+    monkeypatch.setattr(stt, "_get_local_pool", _broken)
+    assert stt._recognize_chunks([b"a", b"b"], "hi", "vosk") == ["g1", "g2"]
+    assert stt._local_failed
+
+
+@pytest.mark.parametrize(
+    "language, code",
+    [(None, "en"), ("", "en"), ("hi", "hi"), ("hi-IN", "hi"), ("kn_IN", "kn"), ("Hindi", "hi"), (" Kannada ", "kn"), ("-", "en")],
+)
+def test_language_code(language, code):
+    assert stt._language_code(language) == code
+
+
+def test_select_backend(monkeypatch, local_backend):
+    monkeypatch.setattr(stt, "STT_BACKEND", "auto")
+    assert stt._select_backend("hi") == "vosk"
+    assert stt._select_backend("en") == "google"
+    assert stt._select_backend("hi", "google") == "google"
+    assert stt._select_backend("hi", "VOSK") == "vosk"
+    assert stt._select_backend("en", "vosk") == "google"
+    monkeypatch.setattr(stt, "STT_BACKEND", "google")
+    assert stt._select_backend("hi") == "google"
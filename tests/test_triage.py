@@ -0,0 +1,118 @@
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.utils import triage
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=4)
+    monkeypatch.setattr(triage, "available", lambda: True)
+    monkeypatch.setattr(triage, "_get_pool", lambda: executor)
+    monkeypatch.setattr(triage, "_ready", True)
+    monkeypatch.setattr(triage, "_pool_failed", False)
+    monkeypatch.setattr(triage, "_inflight", 0)
+    monkeypatch.setattr(triage, "_counts", {"triaged": 0, "escalated": 0})
+    monkeypatch.setattr(triage, "_latency", {"triaged": deque(maxlen=1000), "escalated": deque(maxlen=1000)})
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def _classifier(monkeypatch, label, prob):
+    monkeypatch.setattr(triage, "_classify", lambda image: (label, prob))
+
+
+def test_confident_known_label_is_answered_from_template(monkeypatch, pool):
+    _classifier(monkeypatch, "leaf_rust", 0.93)
+    result = asyncio.run(triage.triage(b"img"))
+    assert result["disease"] == "Leaf rust"
+    assert result["confidence"] == 0.93
+    assert result["source"] == "triage"
+
+
+@pytest.mark.parametrize("label, prob", [("leaf_rust", triage.TRIAGE_THRESHOLD - 0.01), ("mosaic_virus", 0.99)])
+def test_low_confidence_or_unknown_label_escalates(monkeypatch, pool, label, prob):
+    _classifier(monkeypatch, label, prob)
+    assert asyncio.run(triage.triage(b"img")) is None
+
+
+def test_not_ready_escalates_without_submitting(monkeypatch, pool):
+    monkeypatch.setattr(triage, "_ready", False)
+    monkeypatch.setattr(triage, "_get_pool", lambda: pytest.fail("pool used before warm-up"))
+    assert asyncio.run(triage.triage(b"img")) is None
+
+
+def test_inflight_cap_escalates_and_slots_are_released(monkeypatch, pool):
+    monkeypatch.setattr(triage, "TRIAGE_MAX_INFLIGHT", 2)
+    release = threading.Event()
+
+    def _slow(image):
+        release.wait(2)
+        return "healthy", 0.99
+
+    monkeypatch.setattr(triage, "_classify", _slow)
+
+    async def _run():
+        first = [asyncio.create_task(triage.triage(b"img")) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert triage._inflight == 2
+        # The cap is reached: this one is escalated immediately
+        assert await triage.triage(b"img") is None
+        release.set()
+        return await asyncio.gather(*first)
+
+    results = asyncio.run(_run())
+    assert [r["disease"] for r in results] == ["Healthy", "Healthy"]
+    pool.shutdown(wait=True)
+    assert triage._inflight == 0
+
+
+def test_timed_out_job_keeps_its_slot_until_it_finishes(monkeypatch, pool):
+    monkeypatch.setattr(triage, "TRIAGE_TIMEOUT_S", 0.05)
+    release = threading.Event()
+    monkeypatch.setattr(triage, "_classify", lambda image: release.wait(2) and ("healthy", 0.99))
+    assert asyncio.run(triage.triage(b"img")) is None
+    assert triage._inflight == 1
+    release.set()
+    pool.shutdown(wait=True)
+    assert triage._inflight == 0
+
+
+def test_broken_pool_disables_triage(monkeypatch, pool):
+    class _BrokenPool:
+        def submit(self, fn, *args):
+            f = Future()
+            f.set_exception(BrokenProcessPool("worker died"))
+            return f
+
+    monkeypatch.setattr(triage, "_get_pool", lambda: _BrokenPool())
+    monkeypatch.setattr(triage, "available", lambda: not triage._pool_failed)
+    assert asyncio.run(triage.triage(b"img")) is None
+    assert triage._pool_failed
+    assert triage._inflight == 0
+    assert triage.metrics()["model_available"] is False
+
+
+def test_metrics(pool):
+    for seconds in (0.01, 0.02, 0.03):
+        triage.record(False, seconds)
+    triage.record(True, 1.0)
+    m = triage.metrics()
+    assert m["requests"] == 4
+    assert m["triaged"] == 3 and m["escalated"] == 1
+    assert m["escalation_rate"] == 0.25
+    assert m["triaged_latency_ms"]["p50"] == pytest.approx(20.0)
+    assert m["escalated_latency_ms"]["p95"] == pytest.approx(1000.0)
+    assert m["ready"] is True and m["inflight"] == 0
+
+
+def test_metrics_without_traffic(pool):
+    m = triage.metrics()
+    assert m["requests"] == 0
+    assert m["escalation_rate"] is None
+    assert m["triaged_latency_ms"] == {"p50": None, "p95": None}